@@ -0,0 +1,30 @@
+import os
+import time
+import logging
+import redis
+
+logger = logging.getLogger('gis_scraper')
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis-cache")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+
+def bump_table_version(table_name):
+    """
+    Increment the table's version counter in Redis so the API treats any cached
+    responses built from the previous data as stale.
+
+    Cache invalidation must never fail a scrape, so Redis errors are only logged.
+    """
+    try:
+        client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, socket_timeout=5)
+        pipe = client.pipeline(transaction=True)
+        pipe.incr(f"table_version:{table_name}")
+        # Read by the API to keep just-changed tables off a lagging read replica
+        pipe.set(f"table_version_at:{table_name}", time.time())
+        version, _ = pipe.execute()
+        client.close()
+        logger.info(f"Bumped cache version for {table_name} to {version}")
+        return version
+    except redis.RedisError as e:
+        logger.warning(f"Could not bump cache version for {table_name}: {str(e)}")
+        return None
@@ -1,6 +1,7 @@
 import psycopg2
 from psycopg2.extras import Json
 from db_conn_config import get_db_connection
+from cache_invalidation import bump_table_version
 import json
 
 def update_water_mains_data(city, dataset_type, data):
@@ -90,6 +91,9 @@ def update_water_mains_data(city, dataset_type, data):
 
         connection.commit()
 
+        # Invalidate API caches built from the previous water_mains data
+        bump_table_version("water_mains")
+
     except Exception as e:
         if connection:
             connection.rollback()
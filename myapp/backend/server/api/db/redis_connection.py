@@ -1,27 +1,103 @@
 import os
-import redis
+import redis.asyncio as redis
 import uuid
 import json
+import time
 
 REDIS_HOST = os.getenv("REDIS_HOST", "redis-cache")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 10))
+REDIS_HMGET_CHUNK_SIZE = int(os.getenv("REDIS_HMGET_CHUNK_SIZE", 1000))
 
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+# Shared asyncio connection pool so concurrent requests don't block the event loop
+redis_pool = redis.ConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    decode_responses=True,
+)
 
-def store_id_list(id_list, expiry_seconds=3600):
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# Separate pool without response decoding for binary payloads (compressed blobs)
+redis_binary_pool = redis.ConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    decode_responses=False,
+)
+
+redis_binary_client = redis.Redis(connection_pool=redis_binary_pool)
+
+async def close_redis():
+    """Close the Redis clients and disconnect every pooled connection."""
+    await redis_client.aclose()
+    await redis_binary_client.aclose()
+    await redis_pool.disconnect()
+    await redis_binary_pool.disconnect()
+
+async def get_table_version(table_name):
+    """Return the data version counter for a table (0 if never bumped)."""
+    version = await redis_client.get(f"table_version:{table_name}")
+    return int(version) if version else 0
+
+async def bump_table_version(table_name):
+    """
+    Increment a table's data version, invalidating caches built from older data,
+    and record when it happened (`table_version_at:{table}`) for replica-lag checks.
+    """
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.incr(f"table_version:{table_name}")
+    pipe.set(f"table_version_at:{table_name}", time.time())
+    version, _ = await pipe.execute()
+    return version
+
+async def tables_changed_within(tables, seconds):
+    """True if any of the tables had its version bumped in the last `seconds` seconds."""
+    if not tables or seconds <= 0:
+        return False
+    bumped_at = await redis_client.mget([f"table_version_at:{table}" for table in tables])
+    cutoff = time.time() - seconds
+    return any(timestamp and float(timestamp) > cutoff for timestamp in bumped_at)
+
+async def hmget_chunked(key, fields, chunk_size=REDIS_HMGET_CHUNK_SIZE, client=None):
+    """
+    Fetch many hash fields in a single round trip.
+
+    Fields are split into HMGET commands of at most `chunk_size` entries so no
+    single command blocks Redis for long, and all chunks are sent in one pipeline.
+    Returns values in the same order as `fields` (None for missing fields).
+    Pass `client=redis_binary_client` for hashes holding binary values.
+    """
+    fields = [str(field) for field in fields]
+    if not fields:
+        return []
+
+    pipe = (client or redis_client).pipeline(transaction=False)
+    for start in range(0, len(fields), chunk_size):
+        pipe.hmget(key, fields[start:start + chunk_size])
+
+    values = []
+    for chunk in await pipe.execute():
+        values.extend(chunk)
+    return values
+
+async def store_id_list(id_list, expiry_seconds=3600):
     """Store a list of IDs in Redis with a unique token."""
     token = str(uuid.uuid4())
-    redis_client.setex(
+    await redis_client.setex(
         f"filter_token:{token}", 
         expiry_seconds,
         json.dumps(id_list)
     )
     return token
 
-def get_ids_from_token(token):
+async def get_ids_from_token(token):
     """Retrieve a list of IDs from Redis using a token."""
-    id_list_json = redis_client.get(f"filter_token:{token}")
+    id_list_json = await redis_client.get(f"filter_token:{token}")
     if not id_list_json:
         return None
     return json.loads(id_list_json)
-
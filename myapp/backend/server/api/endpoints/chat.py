@@ -1,24 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 import re
 import json
+import orjson
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
 
 from ..schemas.chat import (
     ChatRequest, ChatResponse, ChatSessionCreate, 
     ChatSessionResponse, ChatMessageCreate, ChatHistoryResponse
 )
-from ..db.session import get_db
+from ..db.session import get_db, AsyncSessionLocal
 from ..utils.openai_helper import (
     generate_sql_from_query,
     generate_response,
-    generate_map_update_response
+    generate_map_update_response,
+    stream_response,
+    stream_map_update_response
 )
 from ..services.sql_executor import execute_sql_query
+from ..services.query_guard import TOO_EXPENSIVE
+from ..services.sql_cache import get_cached_sql, store_cached_sql, get_sql_cache_stats
+from ..services.chat_writer import chat_writer
+from ..services.fast_responses import fast_response, truncation_note, get_fast_response_stats
 from ..services.chat_service import (
-    create_chat_session, get_chat_session, create_chat_message, 
-    get_chat_history, prepare_chat_history_for_context, extract_metadata_from_response,
-    get_all_chat_history
+    create_chat_session, get_chat_session,
+    get_chat_history, build_chat_context, extract_metadata_from_response
 )
 
 router = APIRouter()
@@ -102,120 +110,283 @@ async def get_session_chat_history(
         logger.error(f"Error getting chat history: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/query", response_model=ChatResponse)
-async def process_chat_query(
-    request: ChatRequest,
-    db: AsyncSession = Depends(get_db),
-):
+@router.get("/sql-cache/stats", response_model=Dict[str, Any])
+async def get_sql_cache_statistics():
+    """Hit-rate metrics of the natural language to SQL cache."""
+    return await get_sql_cache_stats()
+
+@router.get("/fast-response/stats", response_model=Dict[str, Any])
+async def get_fast_response_statistics():
+    """Second LLM calls avoided by templated responses, per result shape."""
+    return await get_fast_response_stats()
+
+async def _start_turn(db: AsyncSession, request: ChatRequest) -> Tuple[str, Optional[str], str, bool]:
     """
-    Process a user's chat query by:
-      1) Creating/ensuring a chat session
-      2) Loading the chat history
-      3) Generating a SQL query from user input
-      4) Running that query & returning a friendly response
+    Steps shared by the blocking and streaming chat endpoints:
+      1) Parse the request
+      2) Check the user's chat session
+      3-4) Build the bounded LLM context
+      5) Queue the new user message for the chat writer
+      6) Detect "show" queries for map filtering
     """
-    try:
-        # 1) Parse the request
-        user_query = request.message
-        session_id = request.session_id
-        logger.info(f"Received chat query: {user_query}")
+    # 1) Parse the request
+    user_query = request.message
+    session_id = request.session_id
+    logger.info(f"Received chat query: {user_query}")
 
-        # 2) Create or retrieve the user's chat session
-        if not session_id:
+    # 2) Create or retrieve the user's chat session
+    if not session_id:
+        # session = await create_chat_session(db, ChatSessionCreate())
+        # session_id = session.session_id
+        logger.info("==[1 chat/query ENDPOINT]==: session_id is None")
+    else:
+        session = await get_chat_session(db, session_id)
+        if not session:
+            # If the provided session_id doesn't exist, create a new session
             # session = await create_chat_session(db, ChatSessionCreate())
             # session_id = session.session_id
-            logger.info("==[1 chat/query ENDPOINT]==: session_id is None")
-        else:
-            session = await get_chat_session(db, session_id)
-            if not session:
-                # If the provided session_id doesn't exist, create a new session
-                # session = await create_chat_session(db, ChatSessionCreate())
-                # session_id = session.session_id
-                logger.info("==[2 chat/query ENDPOINT]==: session_id exists, session: %s", session)
-        
-        # 3) Load chat history from ALL sessions instead of just the current one
-        chat_messages = await get_all_chat_history(db)
-        
-        # 4) Prepare conversation text for the LLM
-        chat_history = prepare_chat_history_for_context(chat_messages)
-        logger.info(f"Chat history: {chat_history}")
+            logger.warning("==[2 chat/query ENDPOINT]==: unknown session_id %s, messages won't be stored", session_id)
+            # Its messages would violate the chat_messages foreign key and fail a whole writer batch
+            session_id = None
+    
+    # 3-4) Build the bounded LLM context: this session's recent messages
+    # plus the dataset notifications from all sessions
+    chat_history = await build_chat_context(db, session_id)
+    logger.debug(f"Chat history: {chat_history}")
 
-        # 5) Record the new user message in the DB
+    # 5) Queue the new user message; the chat writer batches it into one INSERT
+    if session_id:
         user_message = ChatMessageCreate(
             session_id=session_id,
             message_type="user",
             content=user_query
         )
-        await create_chat_message(db, user_message)
+        await chat_writer.enqueue(user_message)
+
+    # 6) Check if "show" query for map filtering
+    is_show_query = re.search(r'\b(show|display|highlight)\b', user_query.lower()) is not None
+    return user_query, session_id, chat_history, is_show_query
+
+async def _generate_turn_sql(user_query: str, chat_history: str) -> Tuple[str, bool]:
+    """
+    7) Reuse SQL generated earlier for the same question and schema,
+    otherwise generate it from user_query + combined chat history.
+    """
+    sql_query = await get_cached_sql(user_query, DB_SCHEMA)
+    sql_from_cache = sql_query is not None
+    if not sql_from_cache:
+        sql_query = await generate_sql_from_query(user_query, DB_SCHEMA, chat_history)
+    if not sql_query:
+        raise HTTPException(status_code=400, detail="Failed to generate SQL query")
+    return sql_query, sql_from_cache
 
-        # 6) Check if "show" query for map filtering
-        is_show_query = re.search(r'\b(show|display|highlight)\b', user_query.lower()) is not None
+async def _execute_turn_sql(user_query: str, sql_query: str, sql_from_cache: bool) -> Dict[str, Any]:
+    """8) Execute the SQL query, caching the SQL once it has run successfully."""
+    query_result = await execute_sql_query(sql_query)
+    logger.info(f"Query result: {query_result.get('total_count', 0)} rows, error: {query_result.get('error')}")
 
-        # 7) Generate SQL from user_query + combined chat history
-        sql_query = generate_sql_from_query(user_query, DB_SCHEMA, chat_history)
-        if not sql_query:
-            raise HTTPException(status_code=400, detail="Failed to generate SQL query")
+    # Only cache SQL that actually ran
+    if not sql_from_cache and "error" not in query_result:
+        await store_cached_sql(user_query, DB_SCHEMA, sql_query)
+    return query_result
 
-        # 8) Execute the SQL query
-        query_result = await execute_sql_query(db, sql_query)
-        logger.info(f"Query result: {query_result}")
+def _show_filter_ids(is_show_query: bool, query_result: Dict[str, Any]) -> Optional[List[int]]:
+    """Object IDs to filter the map by for "show" queries that returned them."""
+    result_list = query_result.get("result")
+    if is_show_query and isinstance(result_list, list):
+        if result_list and isinstance(result_list[0], dict) and "object_id" in result_list[0]:
+            return [item["object_id"] for item in result_list]
+    return None
+
+def _filter_totals(query_result: Dict[str, Any], filter_ids: Optional[List[int]]) -> Tuple[Optional[int], bool]:
+    """Total matches and whether filter_ids was capped at SQL_MAX_ROWS, for show queries."""
+    if not filter_ids:
+        return None, False
+    return query_result.get("total_count", len(filter_ids)), bool(query_result.get("truncated"))
+
+def _static_response(query_result: Dict[str, Any], is_show_query: bool, filter_ids: Optional[List[int]]) -> Optional[str]:
+    """
+    9) The user-facing reply when it doesn't need the LLM, or None when the
+    result should be explained by generate_response / generate_map_update_response.
+    """
+    if is_show_query and isinstance(query_result.get("result"), list):
+        return None if filter_ids else "I couldn't find any water mains matching your criteria."
+
+    # Normal queries
+    if query_result.get("reason") == TOO_EXPENSIVE:
+        return (
+            f"{query_result['error']}. Try narrowing the question, "
+            "for example to a smaller area or fewer attributes."
+        )
+    if "error" in query_result:
+        return f"I encountered an error: {query_result['error']}"
+    if "result" in query_result:
+        if query_result["result"] == "No data found":
+            return "I couldn't find any data matching your criteria."
+        return None
+    return "I couldn't process your query."
+
+def _frontend_data(query_result: Dict[str, Any]) -> Dict[str, Any]:
+    """10) Limit results for front-end"""
+    if "result" in query_result and isinstance(query_result["result"], list):
+        full_result_list = query_result["result"]
+        return {
+            "results": full_result_list[:100],
+            "total_count": query_result.get("total_count", len(full_result_list))
+        }
+    return {}
+
+async def _save_ai_message(session_id: Optional[str], response_text: str,
+                           filter_ids: Optional[List[int]], is_show_query: bool) -> None:
+    """12) Queue assistant's reply as an AI message (only for an existing session)"""
+    if not session_id:
+        return
+    ai_message = ChatMessageCreate(
+        session_id=session_id,
+        message_type="ai",
+        content=response_text,
+        message_metadata=extract_metadata_from_response({
+            "filter_ids": filter_ids,
+            "is_show_query": is_show_query
+        })
+    )
+    await chat_writer.enqueue(ai_message)
+
+@router.post("/query", response_model=ChatResponse)
+async def process_chat_query(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Process a user's chat query by:
+      1) Creating/ensuring a chat session
+      2) Loading the chat history
+      3) Generating a SQL query from user input
+      4) Running that query & returning a friendly response
+    """
+    try:
+        user_query, session_id, chat_history, is_show_query = await _start_turn(db, request)
+        sql_query, sql_from_cache = await _generate_turn_sql(user_query, chat_history)
+        query_result = await _execute_turn_sql(user_query, sql_query, sql_from_cache)
 
         # 9) Build a user-friendly response
-        filter_ids = None
-        if is_show_query and "result" in query_result and isinstance(query_result["result"], list):
-            # "Show" queries: we might only return object_ids
-            result_list = query_result["result"]
-            if result_list and isinstance(result_list[0], dict) and "object_id" in result_list[0]:
-                filter_ids = [item["object_id"] for item in result_list]
-                response_text = generate_map_update_response(len(filter_ids), user_query, chat_history)
-            else:
-                response_text = "I couldn't find any water mains matching your criteria."
-        else:
-            # Normal queries
-            if "error" in query_result:
-                response_text = f"I encountered an error: {query_result['error']}"
-            elif "result" in query_result:
-                result = query_result["result"]
-                if result == "No data found":
-                    response_text = "I couldn't find any data matching your criteria."
-                else:
-                    response_text = generate_response(query_result, user_query, chat_history)
+        filter_ids = _show_filter_ids(is_show_query, query_result)
+        response_text = _static_response(query_result, is_show_query, filter_ids)
+        if response_text is None:
+            response_text = await fast_response(query_result, filter_ids)
+        if response_text is None:
+            if filter_ids:
+                response_text = await generate_map_update_response(len(filter_ids), user_query, chat_history)
+                response_text += truncation_note(query_result, filter_ids)
             else:
-                response_text = "I couldn't process your query."
-
-        # 10) Limit results for front-end
-        data_for_frontend = {}
-        if "result" in query_result and isinstance(query_result["result"], list):
-            full_result_list = query_result["result"]
-            limited_results = full_result_list[:100]
-            data_for_frontend = {
-                "results": limited_results,
-                "total_count": len(full_result_list)
-            }
+                response_text = await generate_response(query_result, user_query, chat_history)
 
         # 11) Prepare final ChatResponse
+        filter_total, filter_truncated = _filter_totals(query_result, filter_ids)
         response = ChatResponse(
             response=response_text,
-            data=data_for_frontend,
+            data=_frontend_data(query_result),
             filter_ids=filter_ids,
+            filter_total=filter_total,
+            filter_truncated=filter_truncated,
             is_show_query=is_show_query,
             session_id=session_id
         )
 
-        # 12) Save assistant's reply as an AI message
-        ai_message = ChatMessageCreate(
-            session_id=session_id,
-            message_type="ai",
-            content=response_text,
-            message_metadata=extract_metadata_from_response({
-                "filter_ids": filter_ids,
-                "is_show_query": is_show_query
-            })
-        )
-        await create_chat_message(db, ai_message)
+        await _save_ai_message(session_id, response_text, filter_ids, is_show_query)
 
         return response
 
     except Exception as e:
         logger.error(f"Error processing chat query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(event: str, data: Any) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {orjson.dumps(data, default=str).decode()}\n\n"
+
+async def _chat_events(request: ChatRequest) -> AsyncIterator[str]:
+    """
+    Run a chat turn, emitting a server-sent event as each stage completes:
+    `sql`, `rows`, `filter` (show queries), `data`, then the answer as
+    `token` events and finally `done` with the full ChatResponse.
+    Failures are reported as an `error` event.
+
+    Opens its own session because a streamed body outlives the request's
+    `get_db` dependency scope.
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            user_query, session_id, chat_history, is_show_query = await _start_turn(db, request)
+
+            sql_query, sql_from_cache = await _generate_turn_sql(user_query, chat_history)
+            yield _sse("sql", {"sql": sql_query, "cached": sql_from_cache})
+
+            query_result = await _execute_turn_sql(user_query, sql_query, sql_from_cache)
+            data_for_frontend = _frontend_data(query_result)
+            yield _sse("rows", {
+                "total_count": data_for_frontend.get("total_count", 0),
+                "truncated": query_result.get("truncated", False),
+                "error": query_result.get("error"),
+            })
+
+            filter_ids = _show_filter_ids(is_show_query, query_result)
+            filter_total, filter_truncated = _filter_totals(query_result, filter_ids)
+            if filter_ids:
+                yield _sse("filter", {
+                    "filter_ids": filter_ids,
+                    "count": len(filter_ids),
+                    "total_count": filter_total,
+                    "truncated": filter_truncated,
+                })
+            yield _sse("data", data_for_frontend)
+
+            response_text = _static_response(query_result, is_show_query, filter_ids)
+            if response_text is None:
+                response_text = await fast_response(query_result, filter_ids)
+            if response_text is not None:
+                yield _sse("token", {"text": response_text})
+            else:
+                if filter_ids:
+                    tokens = stream_map_update_response(len(filter_ids), user_query, chat_history)
+                else:
+                    tokens = stream_response(query_result, user_query, chat_history)
+                parts = []
+                async for token in tokens:
+                    parts.append(token)
+                    yield _sse("token", {"text": token})
+                note = truncation_note(query_result, filter_ids)
+                if note:
+                    parts.append(note)
+                    yield _sse("token", {"text": note})
+                response_text = "".join(parts).strip()
+
+            await _save_ai_message(session_id, response_text, filter_ids, is_show_query)
+
+            yield _sse("done", ChatResponse(
+                response=response_text,
+                data=data_for_frontend,
+                filter_ids=filter_ids,
+                filter_total=filter_total,
+                filter_truncated=filter_truncated,
+                is_show_query=is_show_query,
+                session_id=session_id
+            ).model_dump())
+
+        except HTTPException as e:
+            yield _sse("error", {"detail": e.detail})
+        except Exception as e:
+            logger.error(f"Error streaming chat query: {str(e)}")
+            yield _sse("error", {"detail": str(e)})
+
+@router.post("/query/stream")
+async def stream_chat_query(request: ChatRequest):
+    """
+    Streaming variant of `/query` as server-sent events, so the map filter
+    can be applied before the natural-language answer is complete.
+    """
+    return StreamingResponse(
+        _chat_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
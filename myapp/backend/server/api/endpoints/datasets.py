@@ -1,15 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 import json
+import orjson
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel
-import requests
 import logging
 
-from ..db.session import get_db
+from ..db.session import get_db, AsyncSessionLocal
 from ..services.dataset_service import register_dataset, get_dataset_config
+from ..services.ingestion import fetch_and_store_data, get_ingestion_job
 from ..db.redis_connection import redis_client
+from ..services.layer_cache import get_layer_blob, store_layer_blob, layer_blob_response
+from ..utils.streaming import STREAM_FORMAT_PATTERN, json_default, iter_hash_values, iter_query_rows, streaming_records_response
 from ..services.chat_service import create_chat_session, get_chat_session
 from ..schemas.chat import ChatSessionCreate
 
@@ -51,175 +54,6 @@ class DatasetResponse(BaseModel):
 #     schema: Dict[str, Any]
 
 
-from datetime import datetime
-
-def convert_timestamp(value):
-    # Check if the value is an integer that looks like a Unix timestamp in milliseconds.
-    if isinstance(value, int) and value > 1e9:
-        return datetime.fromtimestamp(value / 1000)
-    return value
-
-#
-# Background ingestion function (async)
-#
-async def fetch_and_store_data(db: AsyncSession, config: Dict[str, Any], offset: int = 0) -> None:
-    """
-    Fetch and store data from ArcGIS REST endpoint in the background.
-    Paginates, upserts into Postgres, and caches in Redis.
-    """
-    logger.info("[1] Starting data fetch and store. Table: %s, Offset: %d", config['table_name'], offset)
-    logger.debug("[2] Config details: %s", json.dumps(config, indent=2))
-    
-    try:
-        # Build request params for ArcGIS
-        params = {
-            'where': '1=1',
-            'outFields': '*',
-            'returnGeometry': 'true',
-            'outSR': '4326',
-            'f': 'json',
-            'resultOffset': offset,
-            'resultRecordCount': config['max_record_count']  # ensure you have 'max_record_count' in config
-        }
-        url = f"{config['base_url']}/query"
-        
-        logger.info("[4] Making request to URL: %s", url)
-        response = requests.get(url, params=params)
-        logger.info("[5] Response status code: %d", response.status_code)
-        
-        data = response.json()
-        features_list = data.get('features', [])
-        
-        if not features_list:
-            logger.info("[7] No features found for table: %s at offset: %d", config['table_name'], offset)
-            return
-        
-        logger.info("[8] Processing %d features", len(features_list))
-        features = []
-
-        # Determine ArcGIS geometry type (Polyline, Point, Polygon, etc.)
-        arcgis_geom_type = config['geometry_type'].replace('esriGeometry', '').lower()
-
-        for idx, feature in enumerate(features_list, 1):
-            geom = feature.get('geometry', {})
-            attrs = feature.get('attributes', {})
-
-            # Convert ArcGIS geometry to WKT
-            wkt = None
-            if arcgis_geom_type == 'polyline' and 'paths' in geom:
-                # For simplicity, just use the first path
-                path = geom['paths'][0]
-                # Build a standard WKT LINESTRING
-                coords = ", ".join(f"{p[0]} {p[1]}" for p in path)
-                wkt = f"LINESTRING({coords})"
-
-            elif arcgis_geom_type == 'point' and 'x' in geom and 'y' in geom:
-                wkt = f"POINT({geom['x']} {geom['y']})"
-
-            elif arcgis_geom_type == 'polygon' and 'rings' in geom:
-                # For simplicity, use the first ring
-                ring = geom['rings'][0]
-                coords = ", ".join(f"{p[0]} {p[1]}" for p in ring)
-                wkt = f"POLYGON(({coords}))"
-
-            else:
-                logger.warning("Unsupported geometry type for feature: %s", feature)
-                continue
-
-            # Build a dict of columns => values
-            feature_data = {
-                "objectid": attrs.get("OBJECTID") or attrs.get("objectid"),
-                # "dataset_type": config["name"],  # or whatever you like
-                "geometry": wkt,  # We'll pass the raw WKT string
-            }
-            
-            # Copy over all other attributes, lowercasing keys
-            # but skip the geometry columns to avoid collisions
-            for field_name, value in attrs.items():
-                lname = field_name.lower()
-                if lname not in ("objectid", "shape"):  
-                    if lname.endswith("date"):
-                        value = convert_timestamp(value)
-                    # store everything else
-                    feature_data[lname] = value
-
-            features.append(feature_data)
-
-        if not features:
-            logger.info("[10] After filtering, no valid features remain.")
-            return
-
-        # Build the INSERT statement with named placeholders
-        columns = list(features[0].keys())  # all the keys from the first dict
-        # We'll build something like: INSERT INTO roads_data (col1, col2, geometry, ...)
-        # VALUES (:col1, :col2, ST_GeomFromText(:geometry, 4326), ...)
-        # ON CONFLICT (object_id) DO UPDATE ...
-
-        insert_cols = []
-        insert_vals = []
-        update_cols = []
-
-        for col in columns:
-            if col == "geometry":
-                # We'll handle geometry via ST_GeomFromText
-                insert_cols.append("geometry")
-                insert_vals.append("ST_GeomFromText(:geometry, 4326)")
-                # geometry is updated with "EXCLUDED.geometry"
-                update_cols.append(f"{col} = EXCLUDED.{col}")
-            else:
-                insert_cols.append(col)
-                insert_vals.append(f":{col}")
-                if col != "objectid":  # don't update the primary key
-                    update_cols.append(f"{col} = EXCLUDED.{col}")
-
-        insert_sql = f"""
-        INSERT INTO {config['table_name']} ({", ".join(insert_cols)})
-        VALUES ({", ".join(insert_vals)})
-        """
-
-        logger.info("[12] Preparing to insert %d features", len(features))
-        logger.debug("[13] Using SQL:\n%s", insert_sql)
-        
-        # Insert all features in one executemany call
-        logger.info("[14] Executing database insert")
-        await db.execute(text(insert_sql), features)
-        await db.commit()
-        logger.info("[15] Database commit successful")
-        
-        
-        
-        
-
-        # OPTIONAL: If you're caching in Redis, you can do that here
-        for feat in features:
-            redis_client.hset(
-                f"{config['table_name']}:all",
-                str(feat['objectid']),
-                json.dumps(feat, default=str)
-
-            )
-        logger.info("[17] Redis caching complete")
-
-        # If exactly max_record_count were returned, there's likely more to fetch
-        if len(features_list) == config['max_record_count']:
-            next_offset = offset + config['max_record_count']
-            logger.info("[18] More features available, fetching next batch at offset: %d", next_offset)
-            await fetch_and_store_data(db, config, next_offset)
-            
-        else:
-            logger.info("<==fetch_and_store_data [19]==> No more features available from ArcGIS endpoint")
-            
-            # No more data, ingestion is complete
-            redis_client.set(f"{config['table_name']}:ingestion_status", "complete")
-            redis_client.set(f"{config['table_name']}:ingestion_progress", "100")
-            
-            logger.info("<==fetch_and_store_data [20]==> Redis: Ingestion complete")
-            
-            
-    except Exception as e:
-        logger.error("[19] Error in fetch_and_store_data: %s", str(e), exc_info=True)
-        raise Exception(f"Failed to fetch and store data: {str(e)}")
-
 #
 # 1) POST /datasets/register -> Register new dataset, start ingestion
 #
@@ -264,7 +98,7 @@ async def register_new_dataset(
         )
         
         # 2) Start the background ingestion job
-        background_tasks.add_task(fetch_and_store_data, db, config)
+        background_tasks.add_task(fetch_and_store_data, config)
 
         # 3) Return the final data needed by DatasetResponse
         return DatasetResponse(**config)
@@ -315,33 +149,74 @@ async def list_datasets(db: AsyncSession = Depends(get_db)):
         logger.error("Failed to list datasets: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+async def iter_dataset_rows(table_name: str, primary: bool = False):
+    """
+    Yield dataset rows from Postgres with geometry converted to WKT, from the
+    read replica unless `primary` is set (required when the rows fill a cache).
+    """
+    query = text(f"SELECT t.*, ST_AsText(t.geometry) AS geometry_wkt FROM {table_name} t")
+    session_factory = AsyncSessionLocal if primary else None
+    async for row in iter_query_rows(query, session_factory=session_factory):
+        row["geometry"] = row.pop("geometry_wkt")
+        # Internal change-detection digest, not part of the dataset
+        row.pop("feature_hash", None)
+        yield row
+
 #
 # 3) GET /datasets/{table_name}/data -> read dataset data
 #
 @router.get("/{table_name}/data")
-async def get_dataset_data(table_name: str, db: AsyncSession = Depends(get_db)):
-    """Get data for a specific dataset."""
+async def get_dataset_data(
+    table_name: str,
+    request: Request,
+    format: Optional[str] = Query(None, pattern=STREAM_FORMAT_PATTERN),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get data for a specific dataset.
+    Cache hits are served from a precomputed compressed blob with ETag support.
+    With `format=ndjson` or `format=geojson` records are streamed via HSCAN
+    (or a server-side cursor when not cached) with flat memory use.
+    """
     logger.info("[26] Fetching data for dataset: %s", table_name)
     try:
         config = await get_dataset_config(db, table_name)
         if not config:
             logger.error("[28] Dataset not found: %s", table_name)
             raise HTTPException(status_code=404, detail="Dataset not found")
+
+        if format:
+            logger.info("[29a] Streaming %s as %s", table_name, format)
+            if await redis_client.exists(f"{table_name}:all"):
+                records = iter_hash_values(f"{table_name}:all")
+            else:
+                records = iter_dataset_rows(table_name)
+            return streaming_records_response(records, format, "objectid")
         
-        # Attempt to read from Redis cache first
-        cached_data = redis_client.hgetall(f"{table_name}:all")
+        # Attempt to serve the precomputed blob, then the Redis hash
+        blob, version = await get_layer_blob(f"{table_name}:all", table_name)
+        if blob:
+            logger.info("[29] Returning precomputed blob for %s", table_name)
+            return await layer_blob_response(request, blob)
+
+        cached_data = await redis_client.hgetall(f"{table_name}:all")
         if cached_data:
             logger.info("[30] Returning %d cached records", len(cached_data))
-            return [json.loads(val) for val in cached_data.values()]
+            # Cached values are already JSON documents, join them without decoding
+            payload = ("[" + ",".join(cached_data.values()) + "]").encode()
+            blob = await store_layer_blob(f"{table_name}:all", payload, version)
+            return await layer_blob_response(request, blob)
 
-        # If no cache, read from database
-        result = await db.execute(text(f"SELECT * FROM {table_name}"))
-        rows = result.fetchall()
+        # If no cache, read from the primary: a lagging replica would store old rows
+        # in the hash for the current table version
+        rows = [row async for row in iter_dataset_rows(table_name, primary=True)]
 
         # Also store them in Redis
-        for row in rows:
-            row_dict = dict(row)
-            redis_client.hset(f"{table_name}:all", str(row_dict['objectid']), json.dumps(row_dict))
+        if rows:
+            await redis_client.hset(
+                f"{table_name}:all",
+                mapping={str(row['objectid']): orjson.dumps(row, default=json_default) for row in rows}
+            )
 
         return rows
         
@@ -367,18 +242,16 @@ async def get_dataset_status(table_name: str, db: AsyncSession = Depends(get_db)
         logger.info("<==ENDPOINT: get_dataset_status [39]==> Record count: %d", record_count)
         
         
-        ingestion_status = redis_client.get(f"{table_name}:ingestion_status") or b"unknown"
-        progress = redis_client.get(f"{table_name}:ingestion_progress") or b"0"
-        
-        # Get last update time from Redis (if available)
-        last_update = redis_client.get(f"{table_name}:last_update")
-        
-        # Get ingestion status from Redis
-        ingestion_status = redis_client.get(f"{table_name}:ingestion_status")
-        
-        # Get any error messages if ingestion failed
-        error_message = redis_client.get(f"{table_name}:ingestion_error")
+        # Fetch all ingestion status keys from Redis in a single round trip
+        ingestion_status, progress, last_update, error_message = await redis_client.mget(
+            f"{table_name}:ingestion_status",
+            f"{table_name}:ingestion_progress",
+            f"{table_name}:last_update",
+            f"{table_name}:ingestion_error",
+        )
         
+        job = await get_ingestion_job(table_name) or {}
+
         status_info = {
             "status": ingestion_status if ingestion_status else "unknown",
             "progress":  float(progress) if progress else 0,
@@ -387,6 +260,11 @@ async def get_dataset_status(table_name: str, db: AsyncSession = Depends(get_db)
             "last_update": last_update if last_update else None,
             "ingestion_status": ingestion_status if ingestion_status else "unknown",
             "error_message": error_message if error_message else None,
+            "total_features": int(job["total_count"]) if "total_count" in job else None,
+            "stored_features": int(job["stored_count"]) if "stored_count" in job else None,
+            "changed_features": int(job["changed_count"]) if "changed_count" in job else None,
+            "deleted_features": int(job["deleted_count"]) if "deleted_count" in job else None,
+            "checkpoint": job.get("checkpoint"),
             "geometry_type": config.get("geometry_type"),
             "display_field": config.get("display_field"),
             "description": config.get("description")
@@ -399,3 +277,46 @@ async def get_dataset_status(table_name: str, db: AsyncSession = Depends(get_db)
         logger.error("[38] Error fetching dataset status: %s", str(e), exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/{table_name}/ingestion/resume", response_model=Dict[str, Any])
+async def resume_dataset_ingestion(
+    table_name: str,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """Resume a failed or interrupted ingestion from its last checkpoint."""
+    config = await get_dataset_config(db, table_name)
+    if not config:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    job = await get_ingestion_job(table_name)
+    if not job:
+        raise HTTPException(status_code=404, detail="No ingestion job found for this dataset")
+    if job.get("status") == "complete":
+        raise HTTPException(status_code=409, detail="Ingestion is already complete")
+
+    background_tasks.add_task(fetch_and_store_data, config, True)
+    return {"table_name": table_name, "status": "resuming", "checkpoint": job.get("checkpoint")}
+
+
+@router.post("/{table_name}/refresh", response_model=Dict[str, Any])
+async def refresh_dataset(
+    table_name: str,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Re-ingest a dataset from its ArcGIS source. Features are upserted on
+    objectid and only rows whose attributes or geometry changed are rewritten;
+    rows whose objectid the source no longer returns are deleted.
+    """
+    config = await get_dataset_config(db, table_name)
+    if not config:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    job = await get_ingestion_job(table_name)
+    if job and job.get("status") == "in_progress":
+        raise HTTPException(status_code=409, detail="Ingestion is already in progress")
+
+    background_tasks.add_task(fetch_and_store_data, config)
+    return {"table_name": table_name, "status": "refreshing"}
@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from typing import Dict, Any
+
+from ..db.session import engine, read_engine, pool_stats, DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+router = APIRouter()
+
+@router.get("/pool-stats", response_model=Dict[str, Any])
+async def get_pool_stats():
+    """
+    Connection pool usage for sizing against Postgres `max_connections`.
+    `max_connections_per_engine` is what a single worker process can open.
+    """
+    stats = {
+        "primary": pool_stats(engine),
+        "max_connections_per_engine": DB_POOL_SIZE + DB_MAX_OVERFLOW,
+    }
+    if read_engine is not engine:
+        stats["replica"] = pool_stats(read_engine)
+    return stats
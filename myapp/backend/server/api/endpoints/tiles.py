@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+
+from ..db.session import get_db
+from ..services.dataset_service import get_dataset_config
+from ..services.tile_service import get_tile, is_valid_tile
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.get("/{table_name}/{z}/{x}/{y}.mvt")
+async def get_vector_tile(
+    table_name: str,
+    z: int,
+    x: int,
+    y: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Serve a Mapbox Vector Tile for water_mains or any dataset registered in
+    dataset_configs, so the map only loads features inside the viewport.
+
+    Example request: `/tiles/water_mains/14/4562/5984.mvt`
+    """
+    if not is_valid_tile(z, x, y):
+        raise HTTPException(status_code=400, detail="Invalid tile coordinates")
+
+    config = None
+    if table_name != "water_mains":
+        # Only registered dataset tables may be rendered
+        config = await get_dataset_config(db, table_name)
+        if not config:
+            raise HTTPException(status_code=404, detail="Dataset not found")
+
+    try:
+        tile = await get_tile(db, table_name, config, z, x, y)
+    except Exception as e:
+        logger.error(f"Error rendering tile {table_name}/{z}/{x}/{y}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return Response(
+        content=tile,
+        media_type="application/vnd.mapbox-vector-tile",
+        headers={"Cache-Control": "public, max-age=60"}
+    )
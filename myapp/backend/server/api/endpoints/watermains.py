@@ -1,24 +1,132 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Query, Response
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-import json
-from typing import List
+from sqlalchemy.sql import func
+import orjson
+import os
+from typing import List, Optional
 
 from ..schemas import watermains as schemas
 from ..schemas.watermains import ObjectIDListRequest as GeometryRequest
 from ..db.models import WaterMain
-from ..db.session import get_db
-from ..db.redis_connection import redis_client, store_id_list, get_ids_from_token
+from ..db.session import get_read_db
+from ..db.redis_connection import (
+    redis_client, redis_binary_client, hmget_chunked, store_id_list, get_ids_from_token, get_table_version
+)
+from ..services.layer_cache import get_layer_blob, store_layer_blob, layer_blob_response
+from ..services.watermain_cache import refresh_stale_watermain_cache
+from ..utils.geometry_encoding import (
+    GEOMETRY_FORMAT_PATTERN, GEOMETRY_VARY, TWKB_MEDIA_TYPE, wants_twkb, pack_twkb_records
+)
+from ..utils.streaming import (
+    STREAM_FORMAT_PATTERN, iter_hash_values, iter_query_rows, json_array, streaming_records_response
+)
 
 router = APIRouter()
 
+# Zoom level at and above which geometries are returned unsimplified
+BBOX_FULL_DETAIL_ZOOM = int(os.getenv("BBOX_FULL_DETAIL_ZOOM", 17))
+
+def simplify_tolerance(zoom: Optional[int]) -> float:
+    """
+    Simplification tolerance in degrees for a web map zoom level: roughly the
+    size of one 256px tile pixel, 0 (no simplification) when zoomed in.
+    """
+    if zoom is None or zoom >= BBOX_FULL_DETAIL_ZOOM:
+        return 0.0
+    return 360.0 / (256 * 2 ** zoom)
+
+async def fetch_cached_geometries(object_ids) -> List[dict]:
+    """
+    Look up WKT geometries for the given object_ids in one batched HMGET pass
+    against `watermains:all`, the only hash that keeps WKT (binary clients use
+    the smaller `watermains:geom:twkb` projection instead).
+    IDs missing from the cache or without geometry are skipped.
+    """
+    cached_values = await hmget_chunked("watermains:all", object_ids)
+
+    geometries = []
+    for obj_id, record in zip(object_ids, cached_values):
+        geometry = orjson.loads(record)["geometry"] if record else None
+        if geometry:
+            geometries.append({"object_id": int(obj_id), "geometry": geometry})
+    return geometries
+
+async def cached_geometries_response(object_ids, twkb: bool, not_found_detail: str) -> Response:
+    """
+    Build the response for a by-ID geometry lookup, either as JSON with WKT or
+    as framed TWKB records read from `watermains:geom:twkb`.
+    """
+    if twkb:
+        cached_values = await hmget_chunked("watermains:geom:twkb", object_ids, client=redis_binary_client)
+        body = pack_twkb_records(zip(object_ids, cached_values))
+        if not body:
+            raise HTTPException(status_code=404, detail=not_found_detail)
+        return Response(content=body, media_type=TWKB_MEDIA_TYPE, headers={"Vary": "Accept"})
+
+    geometries = await fetch_cached_geometries(object_ids)
+    if not geometries:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    return ORJSONResponse(content=geometries, headers={"Vary": "Accept"})
+
 @router.get("/", response_model=list[schemas.WaterMainResponse])
-async def get_water_mains(db: AsyncSession = Depends(get_db)):
+async def get_water_mains(
+    format: Optional[str] = Query(None, pattern=STREAM_FORMAT_PATTERN),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Fetch all watermains from the database (read replica when configured).
+
+    With `format=ndjson` or `format=geojson` rows are streamed from a
+    server-side cursor (geometry as WKT / GeoJSON) instead of being loaded
+    into memory and validated as one list.
+    """
+    if format:
+        columns = [col for col in WaterMain.__table__.columns if col.name != "geometry"]
+        query = select(*columns, func.ST_AsText(WaterMain.geometry).label("geometry"))
+        return streaming_records_response(iter_query_rows(query), format, "object_id")
+
     result = await db.execute(select(WaterMain))
     return result.scalars().all()
 
+# ✅ Declared before `/{object_id}` so "bbox" isn't parsed as an object_id
+@router.get("/bbox", response_model=List[dict])
+async def get_water_mains_in_bbox(
+    minx: float = Query(..., ge=-180, le=180),
+    miny: float = Query(..., ge=-90, le=90),
+    maxx: float = Query(..., ge=-180, le=180),
+    maxy: float = Query(..., ge=-90, le=90),
+    zoom: Optional[int] = Query(None, ge=0, le=22),
+):
+    """
+    Stream object_ids and WKT geometries of the water mains intersecting a
+    viewport (EPSG:4326), simplified according to the map zoom level.
+
+    The `&&` bounding-box test uses the idx_water_mains_geometry GiST index;
+    ST_Intersects then discards index false positives.
+
+    Example request: `/watermains/bbox?minx=-80.6&miny=43.4&maxx=-80.4&maxy=43.5&zoom=14`
+    """
+    if minx >= maxx or miny >= maxy:
+        raise HTTPException(status_code=400, detail="Invalid bounding box: min must be less than max.")
+
+    envelope = func.ST_MakeEnvelope(minx, miny, maxx, maxy, 4326)
+    tolerance = simplify_tolerance(zoom)
+    geometry = WaterMain.geometry
+    if tolerance:
+        geometry = func.ST_Simplify(geometry, tolerance, True)
+
+    query = (
+        select(WaterMain.object_id, func.ST_AsText(geometry).label("geometry"))
+        .where(WaterMain.geometry.op("&&")(envelope))
+        .where(func.ST_Intersects(WaterMain.geometry, envelope))
+    )
+
+    return StreamingResponse(json_array(iter_query_rows(query)), media_type="application/json")
+
 @router.get("/{object_id}", response_model=schemas.WaterMainResponse)
-async def get_water_main(object_id: int, db: AsyncSession = Depends(get_db)):
+async def get_water_main(object_id: int, db: AsyncSession = Depends(get_read_db)):
     result = await db.execute(select(WaterMain).where(WaterMain.object_id == object_id))
     water_main = result.scalars().first()
     if not water_main:
@@ -27,61 +135,97 @@ async def get_water_main(object_id: int, db: AsyncSession = Depends(get_db)):
 
 # ✅ New Redis-based endpoint
 @router.get("/cached/", response_model=list[schemas.WaterMainResponse])
-async def get_cached_water_mains():
+async def get_cached_water_mains(
+    request: Request,
+    format: Optional[str] = Query(None, pattern=STREAM_FORMAT_PATTERN)
+):
     """
     Fetch all watermains data from Redis cache.
+
+    Served from a precomputed (JSON/gzip/brotli) blob with a strong ETag; the
+    blob is rebuilt when missing or stale for the table version, reloading the
+    hash from Postgres first if it was built before the last version bump.
+    With `format=ndjson` or `format=geojson` the hash is streamed with HSCAN.
     """
-    cached_data = redis_client.hgetall("watermains:all")
-    if not cached_data:
-        raise HTTPException(status_code=404, detail="No cached watermains data found.")
+    if format:
+        await refresh_stale_watermain_cache(await get_table_version("water_mains"))
+        return streaming_records_response(iter_hash_values("watermains:all"), format, "object_id")
+
+    blob, version = await get_layer_blob("watermains:all", "water_mains")
+    if not blob and await refresh_stale_watermain_cache(version):
+        blob, version = await get_layer_blob("watermains:all", "water_mains")
+    if not blob:
+        cached_data = await redis_client.hgetall("watermains:all")
+        if not cached_data:
+            raise HTTPException(status_code=404, detail="No cached watermains data found.")
+
+        # Cached values are already JSON documents, join them without decoding
+        payload = ("[" + ",".join(cached_data.values()) + "]").encode()
+        blob = await store_layer_blob("watermains:all", payload, version)
 
-    # Convert Redis data to list of dictionaries
-    return [json.loads(wm) for wm in cached_data.values()]
+    return await layer_blob_response(request, blob)
 
 # ✅ Get all cached geometries with object_ids
 @router.get("/cached/geometry", response_model=List[dict])
-async def get_cached_geometries():
+async def get_cached_geometries(
+    request: Request,
+    format: Optional[str] = Query(None, pattern=GEOMETRY_FORMAT_PATTERN)
+):
     """
     Fetch all geometries and object_ids from Redis cache.
+
+    Served from the precomputed `watermains:geom` blob (object_id + WKT) built
+    with the cache; if it is missing it is rebuilt from the `watermains:all`
+    records. The blob is compressed and served with ETag / If-None-Match support.
+
+    With `format=twkb` (or `Accept: application/vnd.webgis.twkb`) the body is a
+    sequence of <uint32 object_id><uint32 length><TWKB> records instead.
     """
-    cached_data = redis_client.hgetall("watermains:all")
-    if not cached_data:
-        raise HTTPException(status_code=404, detail="No cached watermains data found.")
+    if wants_twkb(request, format):
+        blob, version = await get_layer_blob("watermains:geom:twkb", "water_mains")
+        if not blob and await refresh_stale_watermain_cache(version):
+            blob, version = await get_layer_blob("watermains:geom:twkb", "water_mains")
+        if not blob:
+            cached_data = await redis_binary_client.hgetall("watermains:geom:twkb")
+            if not cached_data:
+                raise HTTPException(status_code=404, detail="No cached watermains data found.")
+            payload = pack_twkb_records((int(obj_id), geometry) for obj_id, geometry in cached_data.items())
+            blob = await store_layer_blob("watermains:geom:twkb", payload, version, TWKB_MEDIA_TYPE)
+        return await layer_blob_response(request, blob, GEOMETRY_VARY)
 
-    # Extract only object_id and geometry
-    geometries = [
-        {
-            "object_id": int(obj_id),
-            "geometry": json.loads(data).get("geometry")
-        }
-        for obj_id, data in cached_data.items()
-        if json.loads(data).get("geometry")
-    ]
+    blob, version = await get_layer_blob("watermains:geom", "water_mains")
+    if not blob and await refresh_stale_watermain_cache(version):
+        blob, version = await get_layer_blob("watermains:geom", "water_mains")
+    if not blob:
+        cached_data = await redis_client.hgetall("watermains:all")
+        if not cached_data:
+            raise HTTPException(status_code=404, detail="No cached watermains data found.")
 
-    return geometries
+        records = (orjson.loads(record) for record in cached_data.values())
+        geometries = [
+            {"object_id": record["object_id"], "geometry": record["geometry"]}
+            for record in records if record["geometry"]
+        ]
+        blob = await store_layer_blob("watermains:geom", orjson.dumps(geometries), version)
+
+    return await layer_blob_response(request, blob, GEOMETRY_VARY)
 
 # ✅ Get geometries for a list of object_ids using path parameters
 @router.get("/cached/geometry/{object_ids}", response_model=list[dict])
-async def get_cached_geometry_by_path(object_ids: str):
+async def get_cached_geometry_by_path(
+    object_ids: str,
+    request: Request,
+    format: Optional[str] = Query(None, pattern=GEOMETRY_FORMAT_PATTERN)
+):
     """
     Fetch geometries for a list of object_ids from Redis cache via path parameters.
 
-    Example request: `/cached/geometry/259489,259490`
+    Example request: `/cached/geometry/259489,259490` (add `?format=twkb` for binary)
     """
     ids_list = object_ids.split(",")  # Convert comma-separated string to list of IDs
-    cached_geometries = []
-
-    for obj_id in ids_list:
-        cached_data = redis_client.hget("watermains:all", obj_id)
-        if cached_data:
-            watermain = json.loads(cached_data)
-            if "geometry" in watermain:
-                cached_geometries.append({"object_id": int(obj_id), "geometry": watermain["geometry"]})
-
-    if not cached_geometries:
-        raise HTTPException(status_code=404, detail="No matching geometries found in cache.")
-
-    return cached_geometries
+    return await cached_geometries_response(
+        ids_list, wants_twkb(request, format), "No matching geometries found in cache."
+    )
 
 # ✅ Moved this BELOW `/cached/geometry` to avoid conflicts
 @router.get("/cached/{object_id}", response_model=schemas.WaterMainResponse)
@@ -89,32 +233,25 @@ async def get_cached_water_main(object_id: int):
     """
     Fetch a single watermain from Redis cache by object_id.
     """
-    cached_data = redis_client.hget("watermains:all", str(object_id))  # ✅ Use hget instead of get
+    cached_data = await redis_client.hget("watermains:all", str(object_id))  # ✅ Use hget instead of get
     if not cached_data:
         raise HTTPException(status_code=404, detail="No cached watermains data found.")
 
-    return json.loads(cached_data)
+    # The cached value is already a serialized WaterMainResponse, skip decode/re-encode
+    return Response(content=cached_data, media_type="application/json")
 
 @router.post("/cached/geometry", response_model=List[dict])
-async def get_geometries_by_ids(request: GeometryRequest):
+async def get_geometries_by_ids(
+    request: GeometryRequest,
+    http_request: Request,
+    format: Optional[str] = Query(None, pattern=GEOMETRY_FORMAT_PATTERN)
+):
     """
     Fetch geometries for multiple watermains from Redis cache by object_ids.
     """
-    geometries = []
-    for object_id in request.object_ids:
-        cached_data = redis_client.hget("watermains:all", str(object_id))
-        if cached_data:
-            watermain = json.loads(cached_data)
-            if "geometry" in watermain:
-                geometries.append({
-                    "object_id": object_id,
-                    "geometry": watermain["geometry"]
-                })
-    
-    if not geometries:
-        raise HTTPException(status_code=404, detail="No geometries found for the provided IDs.")
-    
-    return geometries
+    return await cached_geometries_response(
+        request.object_ids, wants_twkb(http_request, format), "No geometries found for the provided IDs."
+    )
 
 # Create a token for filter IDs
 @router.post("/filter-token", response_model=dict)
@@ -123,28 +260,23 @@ async def create_filter_token(request: GeometryRequest):
     Create a token that represents a list of object IDs for filtering.
     Returns a token that can be used to retrieve the filtered geometries.
     """
-    token = store_id_list(request.object_ids)
+    token = await store_id_list(request.object_ids)
     return {"token": token, "count": len(request.object_ids)}
 
 # Get geometries using a filter token
 @router.get("/cached/geometry/token/{token}", response_model=List[dict])
-async def get_cached_geometry_by_token(token: str):
+async def get_cached_geometry_by_token(
+    token: str,
+    request: Request,
+    format: Optional[str] = Query(None, pattern=GEOMETRY_FORMAT_PATTERN)
+):
     """
     Fetch geometries for a list of object_ids from Redis cache using a token.
     """
-    id_list = get_ids_from_token(token)
+    id_list = await get_ids_from_token(token)
     if not id_list:
         raise HTTPException(status_code=404, detail="Filter token not found or expired")
     
-    cached_geometries = []
-    for obj_id in id_list:
-        cached_data = redis_client.hget("watermains:all", str(obj_id))
-        if cached_data:
-            watermain = json.loads(cached_data)
-            if "geometry" in watermain:
-                cached_geometries.append({"object_id": int(obj_id), "geometry": watermain["geometry"]})
-
-    if not cached_geometries:
-        raise HTTPException(status_code=404, detail="No matching geometries found in cache.")
-
-    return cached_geometries
+    return await cached_geometries_response(
+        id_list, wants_twkb(request, format), "No matching geometries found in cache."
+    )
@@ -11,6 +11,8 @@ class ChatResponse(BaseModel):
     response: str
     data: Optional[Dict[str, Any]] = None
     filter_ids: Optional[List[int]] = None  # For "show" queries
+    filter_total: Optional[int] = None      # Matches before the SQL_MAX_ROWS cap
+    filter_truncated: bool = False          # True when filter_ids holds only the first SQL_MAX_ROWS matches
     is_show_query: Optional[bool] = False   # Flag to indicate map filtering
     session_id: Optional[str] = None
 
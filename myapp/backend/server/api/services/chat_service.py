@@ -1,15 +1,27 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import desc
+import os
 import json
 import logging
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
 from ..db.models import ChatSession, ChatMessage
+from ..db.redis_connection import redis_client
 from ..schemas.chat import ChatMessageCreate, ChatSessionCreate
 
 logger = logging.getLogger(__name__)
 
+# Chat context sent to the LLM: recent messages of the current session plus
+# the system dataset notifications, trimmed to an approximate token budget
+CHAT_CONTEXT_WINDOW = int(os.getenv("CHAT_CONTEXT_WINDOW", 20))  # messages
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", 6000))
+CHAT_CONTEXT_TTL = int(os.getenv("CHAT_CONTEXT_TTL", 3600))  # seconds
+
+SYSTEM_CONTEXT_KEY = "chat_context:system"
+# Leading element of every cached context list, so "cached but empty" is a hit
+CONTEXT_SENTINEL = ""
+
 async def create_chat_session(db: AsyncSession, session_data: ChatSessionCreate) -> ChatSession:
     """Create a new chat session."""
     try:
@@ -48,12 +60,14 @@ async def create_chat_message(db: AsyncSession, message_data: ChatMessageCreate)
         db.add(new_message)
         await db.commit()
         await db.refresh(new_message)
-        return new_message
     except Exception as e:
         logger.error(f"Error creating chat message: {str(e)}")
         await db.rollback()
         raise
 
+    await append_to_chat_context(new_message)
+    return new_message
+
 async def get_chat_history(db: AsyncSession, session_id: str, limit: int = 50) -> List[ChatMessage]:
     """Get chat history for a session."""
     try:
@@ -81,26 +95,134 @@ async def get_all_chat_history(db: AsyncSession, limit: int = 500000) -> List[Ch
         logger.error(f"Error getting all chat history: {str(e)}")
         raise
 
+def format_chat_message(msg: ChatMessage) -> str:
+    """Format a single chat message the way it appears in the LLM context."""
+    if msg.message_type == "user":
+        return f"User: {msg.content}\n\n"
+    elif msg.message_type == "ai":
+        return f"Assistant: {msg.content}\n\n"
+    elif msg.message_type == "system":
+        # Include system messages in the context
+        return f"{msg.content}\n\n"
+    return ""
+
 def prepare_chat_history_for_context(messages: List[ChatMessage]) -> str:
     """
     Format chat messages into a string to provide context for OpenAI.
     Now includes system messages in the context.
     """
-    formatted_history = ""
-    
-    for msg in messages:
-        if msg.message_type == "user":
-            formatted_history += f"User: {msg.content}\n\n"
-        elif msg.message_type == "ai":
-            formatted_history += f"Assistant: {msg.content}\n\n"
-        elif msg.message_type == "system":
-            # Include system messages in the context
-            formatted_history += f"{msg.content}\n\n"
+    formatted_history = "".join(format_chat_message(msg) for msg in messages)
     
-    logger.info(f"\n [prepare_chat_history_for_context] ==||Formatted chat history ||==: {formatted_history}\n")
+    logger.debug(f"\n [prepare_chat_history_for_context] ==||Formatted chat history ||==: {formatted_history}\n")
     
     return formatted_history
 
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+def _session_context_key(session_id: str) -> str:
+    return f"chat_context:session:{session_id}"
+
+async def _load_system_context(db: AsyncSession) -> List[str]:
+    """Load and cache the formatted system (dataset notification) messages."""
+    result = await db.execute(
+        select(ChatMessage)
+        .filter(ChatMessage.message_type == "system")
+        .order_by(ChatMessage.created_at)
+    )
+    entries = [format_chat_message(msg) for msg in result.scalars().all()]
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(SYSTEM_CONTEXT_KEY)
+    pipe.rpush(SYSTEM_CONTEXT_KEY, CONTEXT_SENTINEL, *entries)
+    pipe.expire(SYSTEM_CONTEXT_KEY, CHAT_CONTEXT_TTL)
+    await pipe.execute()
+    return entries
+
+async def _load_session_context(db: AsyncSession, session_id: str) -> List[str]:
+    """Load and cache the formatted last CHAT_CONTEXT_WINDOW messages of a session."""
+    result = await db.execute(
+        select(ChatMessage)
+        .filter(ChatMessage.session_id == session_id)
+        .filter(ChatMessage.message_type != "system")
+        .order_by(desc(ChatMessage.created_at))
+        .limit(CHAT_CONTEXT_WINDOW)
+    )
+    entries = [format_chat_message(msg) for msg in reversed(result.scalars().all())]
+    key = _session_context_key(session_id)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(key)
+    pipe.rpush(key, CONTEXT_SENTINEL, *entries)
+    pipe.expire(key, CHAT_CONTEXT_TTL)
+    await pipe.execute()
+    return entries
+
+def _take_within_budget(entries: List[str], budget: int) -> Tuple[List[str], int]:
+    """Keep the newest entries that fit in `budget` tokens, in chronological order."""
+    kept = []
+    for entry in reversed(entries):
+        if entry == CONTEXT_SENTINEL:
+            continue
+        cost = estimate_tokens(entry)
+        if cost > budget:
+            break
+        kept.append(entry)
+        budget -= cost
+    return list(reversed(kept)), budget
+
+async def build_chat_context(db: AsyncSession, session_id: Optional[str]) -> str:
+    """
+    Build the conversation context for the LLM.
+
+    Uses the system dataset notifications (from any session) plus the current
+    session's last CHAT_CONTEXT_WINDOW messages, both cached in Redis and
+    extended incrementally as messages are created. Newest entries win when
+    the CHAT_CONTEXT_TOKEN_BUDGET is exceeded; dataset notifications are
+    budgeted first because SQL generation depends on them.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.lrange(SYSTEM_CONTEXT_KEY, 0, -1)
+    if session_id:
+        pipe.lrange(_session_context_key(session_id), 0, -1)
+    cached = await pipe.execute()
+
+    system_entries = cached[0] or await _load_system_context(db)
+    session_entries = []
+    if session_id:
+        session_entries = cached[1] or await _load_session_context(db, session_id)
+
+    system_entries, remaining = _take_within_budget(system_entries, CHAT_CONTEXT_TOKEN_BUDGET)
+    session_entries, remaining = _take_within_budget(session_entries, remaining)
+
+    logger.info(
+        f"Built chat context for session {session_id}: {len(system_entries)} system + "
+        f"{len(session_entries)} session messages, ~{CHAT_CONTEXT_TOKEN_BUDGET - remaining} tokens"
+    )
+    return "".join(system_entries) + "".join(session_entries)
+
+async def append_to_chat_context(msg: ChatMessage) -> None:
+    """
+    Append a newly stored message to the cached context lists.
+
+    RPUSHX only extends lists that are already cached, so a cold cache is
+    always rebuilt from the database rather than from a partial list.
+    Cache failures are logged and never fail the message write.
+    """
+    entry = format_chat_message(msg)
+    if not entry:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        if msg.message_type == "system":
+            pipe.rpushx(SYSTEM_CONTEXT_KEY, entry)
+        else:
+            key = _session_context_key(msg.session_id)
+            pipe.rpushx(key, entry)
+            pipe.ltrim(key, -CHAT_CONTEXT_WINDOW, -1)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not update cached chat context: {str(e)}")
+
 def extract_metadata_from_response(response_data: Dict[str, Any]) -> str:
     """
     Extract and format metadata from the response for storage.
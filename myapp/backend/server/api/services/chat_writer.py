@@ -0,0 +1,122 @@
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, DataError
+
+from ..db.models import ChatMessage
+from ..db.session import AsyncSessionLocal
+from ..schemas.chat import ChatMessageCreate
+from .chat_service import append_to_chat_context
+
+logger = logging.getLogger(__name__)
+
+CHAT_WRITER_BATCH_SIZE = int(os.getenv("CHAT_WRITER_BATCH_SIZE", 200))  # messages per INSERT
+CHAT_WRITER_FLUSH_INTERVAL = float(os.getenv("CHAT_WRITER_FLUSH_INTERVAL", 0.5))  # seconds
+CHAT_WRITER_MAX_QUEUE = int(os.getenv("CHAT_WRITER_MAX_QUEUE", 10000))
+CHAT_WRITER_MAX_RETRIES = int(os.getenv("CHAT_WRITER_MAX_RETRIES", 3))
+
+async def write_chat_messages(rows: List[Dict[str, Any]]) -> None:
+    """Persist chat messages with a single multi-row INSERT and one commit."""
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(ChatMessage).values(rows))
+        await db.commit()
+
+# Queued by stop() to make the writer flush and exit
+_STOP = object()
+
+class ChatMessageWriter:
+    """
+    Background writer for chat messages.
+
+    Requests enqueue messages and return immediately; a single task drains
+    the queue every CHAT_WRITER_FLUSH_INTERVAL seconds (or once
+    CHAT_WRITER_BATCH_SIZE messages are waiting) and writes them with one
+    INSERT. `stop()` waits until everything queued has been written.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=CHAT_WRITER_MAX_QUEUE)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Chat message writer started")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        logger.info("Chat message writer stopped")
+
+    async def enqueue(self, message_data: ChatMessageCreate) -> None:
+        """Queue a message for the next batch and add it to the cached LLM context."""
+        row = {
+            "session_id": message_data.session_id,
+            "message_type": message_data.message_type,
+            "content": message_data.content,
+            "message_metadata": message_data.message_metadata,
+            # Set here so the stored order matches the conversation, not the flush
+            "created_at": datetime.utcnow(),
+        }
+        if self._task is None:
+            # Writer not running (e.g. outside the app lifecycle): write through
+            await self._write_batch([row])
+        else:
+            await self._queue.put(row)
+        await append_to_chat_context(ChatMessage(**row))
+
+    def _drain(self, limit: int) -> List[Any]:
+        items = []
+        while len(items) < limit and not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        return items
+
+    async def _run(self) -> None:
+        stopping = False
+        while not (stopping and self._queue.empty()):
+            items = [await self._queue.get()]
+            # Give the rest of the turn (and other turns) a moment to join the batch
+            if items[0] is not _STOP and not stopping and self._queue.qsize() < CHAT_WRITER_BATCH_SIZE - 1:
+                await asyncio.sleep(CHAT_WRITER_FLUSH_INTERVAL)
+            items.extend(self._drain(CHAT_WRITER_BATCH_SIZE - 1))
+
+            stopping = stopping or any(item is _STOP for item in items)
+            await self._write_batch([item for item in items if item is not _STOP])
+
+    async def _write_batch(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Write a batch, retrying transient failures with backoff. A row the
+        database rejects (e.g. an unknown session_id) fails the whole INSERT,
+        so the batch is then written row by row and only the bad rows dropped.
+        """
+        if not rows:
+            return
+        for attempt in range(CHAT_WRITER_MAX_RETRIES + 1):
+            try:
+                await write_chat_messages(rows)
+                logger.debug(f"Stored {len(rows)} chat messages")
+                return
+            except (IntegrityError, DataError) as e:
+                # Retrying the same rows cannot succeed
+                if len(rows) == 1:
+                    logger.error(f"Dropping chat message for session {rows[0]['session_id']}: {str(e.orig)}")
+                    return
+                logger.warning(f"Batch of {len(rows)} chat messages rejected, writing them one by one")
+                for row in rows:
+                    await self._write_batch([row])
+                return
+            except Exception as e:
+                if attempt >= CHAT_WRITER_MAX_RETRIES:
+                    logger.error(f"Dropping {len(rows)} chat messages after {attempt + 1} failed writes: {str(e)}")
+                    return
+                logger.warning(f"Error storing chat messages, retrying: {str(e)}")
+                await asyncio.sleep(0.5 * (2 ** attempt))
+
+chat_writer = ChatMessageWriter()
@@ -9,13 +9,13 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from geoalchemy2 import Geometry
 import requests
 
-# If you need OpenAI
-from openai import OpenAI
 import re
 
-# Configure OpenAI using environment variable
-api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
+from ..utils.openai_helper import create_chat_completion
+from .sql_cache import bump_schema_version
+
+# Schema generation with gpt-4o can take much longer than a chat completion
+OPENAI_SCHEMA_TIMEOUT = float(os.getenv("OPENAI_SCHEMA_TIMEOUT", 120))  # seconds
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -70,7 +70,7 @@ def _extract_indexes(sql_schema: str) -> list:
         if line.strip().startswith('CREATE INDEX')
     ]
 
-def generate_schema_with_ai(server_metadata: Dict[str, Any]) -> Dict[str, Any]:
+async def generate_schema_with_ai(server_metadata: Dict[str, Any]) -> Dict[str, Any]:
     """
     Use AI to generate a PostgreSQL schema based on the server metadata.
     """
@@ -102,8 +102,9 @@ def generate_schema_with_ai(server_metadata: Dict[str, Any]) -> Dict[str, Any]:
         
         """
 
-        # Make a synchronous call to the OpenAI API
-        response = client.chat.completions.create(
+        # Call the OpenAI API without blocking the event loop
+        response = await create_chat_completion(
+            timeout=OPENAI_SCHEMA_TIMEOUT,
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a database expert who creates PostgreSQL schemas."},
@@ -156,6 +157,10 @@ async def create_dynamic_table(db: AsyncSession, table_name: str, schema: Dict[s
     try:
         # Execute the SQL schema
         await db.execute(text(schema['sql_schema']))
+        # Spatial index so tile and bbox queries can use `&&` filtering
+        await db.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{table_name}_geometry ON {table_name} USING GIST(geometry)"
+        ))
         await db.commit()
         
         logger.info("Successfully created table: %s", table_name)
@@ -206,7 +211,7 @@ async def register_dataset(
         server_metadata = await fetch_server_metadata(base_url)
         
         # 2) Generate schema via AI
-        generated_schema = generate_schema_with_ai(server_metadata)
+        generated_schema = await generate_schema_with_ai(server_metadata)
         
         # 2a) Unify the AI's table name with our user-supplied table_name
         fixed_sql = unify_table_name(generated_schema["sql_schema"], table_name)
@@ -285,6 +290,9 @@ async def register_dataset(
         logger.info("Creating system message: %s", system_message)
         
         await create_chat_message(db, system_message)
+
+        # The schema the LLM sees has changed, drop previously generated SQL
+        await bump_schema_version()
         
         logger.info("Successfully registered dataset: %s", name)
         return return_config
@@ -0,0 +1,127 @@
+import os
+import re
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Any, List, Optional
+
+from ..db.redis_connection import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Result shapes answered from a template instead of a second LLM call
+FAST_RESPONSE_SHOW = os.getenv("FAST_RESPONSE_SHOW", "true").lower() == "true"
+FAST_RESPONSE_SCALAR = os.getenv("FAST_RESPONSE_SCALAR", "true").lower() == "true"
+FAST_RESPONSE_ROW = os.getenv("FAST_RESPONSE_ROW", "true").lower() == "true"
+# Wider records are left to the LLM, which can pick out what the question asked for
+FAST_RESPONSE_ROW_MAX_COLUMNS = int(os.getenv("FAST_RESPONSE_ROW_MAX_COLUMNS", 8))
+
+STATS_KEY = "fast_response:stats"
+SHAPES = ("show", "scalar", "row")
+LLM = "llm"
+
+# Column names that say nothing about the value (aggregates without an alias)
+_GENERIC_COLUMNS = {"count", "sum", "avg", "min", "max", "?column?", "result", "st_length"}
+
+# Geometry is not readable in a reply: geometry columns, WKT text and hex EWKB
+# (how asyncpg returns a PostGIS geometry without a codec)
+_GEOMETRY_COLUMNS = {"geometry", "geom", "the_geom", "shape", "geometry_wkt"}
+_GEOMETRY_TEXT = re.compile(
+    r"^(SRID=\d+;)?\s*(POINT|LINESTRING|POLYGON|MULTIPOINT|MULTILINESTRING|MULTIPOLYGON|GEOMETRYCOLLECTION)\b"
+    r"|^0[01]0[0-9A-F]{7,}$",
+    re.IGNORECASE,
+)
+
+def is_displayable(column: str, value: Any) -> bool:
+    """False for geometry and binary values, which a text reply can't show."""
+    if column.lower() in _GEOMETRY_COLUMNS or isinstance(value, (bytes, bytearray, memoryview)):
+        return False
+    return not (isinstance(value, str) and _GEOMETRY_TEXT.match(value))
+
+def format_value(value: Any) -> str:
+    if value is None:
+        return "not available"
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, (float, Decimal)):
+        number = float(value)
+        if number == 0:
+            return "0"
+        if abs(number) < 1:
+            # Two decimals would round small values to "0" or "-0"; keep significant figures
+            return f"{number:.3g}"
+        return f"{number:,.2f}".rstrip("0").rstrip(".")
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M") if (value.hour or value.minute) else value.strftime("%Y-%m-%d")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+def column_label(column: str) -> str:
+    return column.replace("_", " ").strip()
+
+def truncation_note(query_result: Dict[str, Any], filter_ids: Optional[List[int]]) -> str:
+    """Sentence telling the user the map shows only part of a capped show-query result, else ''."""
+    if not filter_ids or not query_result.get("truncated"):
+        return ""
+    return f" Only the first {len(filter_ids):,} of {query_result['total_count']:,} matches are displayed."
+
+def result_shape(query_result: Dict[str, Any], filter_ids: Optional[List[int]]) -> Optional[str]:
+    """Classify a successful result as show / scalar / row, or None when it needs the LLM."""
+    if filter_ids:
+        return "show"
+    rows = query_result.get("result")
+    if not isinstance(rows, list) or len(rows) != 1 or not isinstance(rows[0], dict):
+        return None
+    return "scalar" if len(rows[0]) == 1 else "row"
+
+def render_fast_response(query_result: Dict[str, Any], filter_ids: Optional[List[int]]) -> Optional[str]:
+    """Deterministic reply for simple result shapes, or None if the shape is disabled or not simple."""
+    shape = result_shape(query_result, filter_ids)
+
+    if shape == "show" and FAST_RESPONSE_SHOW:
+        text = (
+            f"I've updated the map to show {len(filter_ids):,} water mains matching your criteria. "
+            "You can click on any highlighted feature for more details."
+        )
+        return text + truncation_note(query_result, filter_ids)
+
+    if shape == "scalar" and FAST_RESPONSE_SCALAR:
+        (column, value), = query_result["result"][0].items()
+        if column.lower() in _GENERIC_COLUMNS:
+            return f"The answer is {format_value(value)}."
+        return f"The {column_label(column)} is {format_value(value)}."
+
+    if shape == "row" and FAST_RESPONSE_ROW:
+        fields = [(column, value) for column, value in query_result["result"][0].items() if is_displayable(column, value)]
+        if fields and len(fields) <= FAST_RESPONSE_ROW_MAX_COLUMNS:
+            lines = [f"{column_label(column)}: {format_value(value)}" for column, value in fields]
+            return "Here is the matching record:\n" + "\n".join(lines)
+
+    return None
+
+async def fast_response(query_result: Dict[str, Any], filter_ids: Optional[List[int]]) -> Optional[str]:
+    """render_fast_response, counting answered shapes and remaining LLM calls."""
+    text = render_fast_response(query_result, filter_ids)
+    path = result_shape(query_result, filter_ids) if text is not None else LLM
+    try:
+        await redis_client.hincrby(STATS_KEY, path, 1)
+    except Exception as e:
+        logger.warning(f"Failed to record fast response stats: {str(e)}")
+    return text
+
+async def get_fast_response_stats() -> Dict[str, Any]:
+    """LLM calls avoided per result shape and the share of responses that needed no LLM."""
+    stats = {key: int(value) for key, value in (await redis_client.hgetall(STATS_KEY)).items()}
+    avoided = {shape: stats.get(shape, 0) for shape in SHAPES}
+    total_avoided = sum(avoided.values())
+    responses = total_avoided + stats.get(LLM, 0)
+    return {
+        "avoided": avoided,
+        "avoided_total": total_avoided,
+        "llm_calls": stats.get(LLM, 0),
+        "avoided_rate": total_avoided / responses if responses else 0.0,
+        "enabled": {"show": FAST_RESPONSE_SHOW, "scalar": FAST_RESPONSE_SCALAR, "row": FAST_RESPONSE_ROW},
+    }
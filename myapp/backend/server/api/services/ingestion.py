@@ -0,0 +1,580 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional, Set, Tuple, Awaitable
+
+import httpx
+import orjson
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.redis_connection import redis_client, bump_table_version
+from ..db.session import AsyncSessionLocal
+from .dataset_service import get_dataset_config
+
+logger = logging.getLogger(__name__)
+
+# ArcGIS pages fetched at once; also bounds the pages held in memory awaiting a write
+ARCGIS_PAGE_CONCURRENCY = int(os.getenv("ARCGIS_PAGE_CONCURRENCY", 4))
+ARCGIS_REQUEST_TIMEOUT = float(os.getenv("ARCGIS_REQUEST_TIMEOUT", 60))  # seconds
+ARCGIS_MAX_RETRIES = int(os.getenv("ARCGIS_MAX_RETRIES", 3))
+ARCGIS_RETRY_DELAY = float(os.getenv("ARCGIS_RETRY_DELAY", 1))  # seconds, doubled per attempt
+# "copy" (COPY into a staging table + one INSERT ... SELECT) or "insert" (executemany)
+INGESTION_LOAD_METHOD = os.getenv("INGESTION_LOAD_METHOD", "copy").lower()
+
+def convert_timestamp(value):
+    # Check if the value is an integer that looks like a Unix timestamp in milliseconds.
+    if isinstance(value, int) and value > 1e9:
+        return datetime.fromtimestamp(value / 1000)
+    return value
+
+async def arcgis_query(client: httpx.AsyncClient, base_url: str, **params) -> Dict[str, Any]:
+    """
+    Run a query against an ArcGIS layer's /query endpoint.
+
+    Uses POST so long objectIds lists fit; transport errors, 5xx responses
+    and ArcGIS error payloads are retried with exponential backoff.
+    """
+    data = {"where": "1=1", "f": "json", **params}
+    for attempt in range(ARCGIS_MAX_RETRIES + 1):
+        try:
+            response = await client.post(f"{base_url}/query", data=data)
+            response.raise_for_status()
+            payload = response.json()
+            if "error" in payload:
+                raise Exception(f"ArcGIS error: {payload['error']}")
+            return payload
+        except Exception as e:
+            # Client errors (bad URL / parameters) won't succeed on retry
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+                raise
+            if attempt >= ARCGIS_MAX_RETRIES:
+                raise
+            delay = ARCGIS_RETRY_DELAY * (2 ** attempt)
+            logger.warning("ArcGIS query failed (%s), retrying in %.1fs", str(e), delay)
+            await asyncio.sleep(delay)
+
+async def fetch_feature_count(client: httpx.AsyncClient, base_url: str) -> int:
+    payload = await arcgis_query(client, base_url, returnCountOnly="true")
+    return int(payload.get("count", 0))
+
+async def fetch_object_ids(client: httpx.AsyncClient, base_url: str) -> List[int]:
+    """All object IDs of the layer, sorted; empty if the service does not support returnIdsOnly."""
+    try:
+        payload = await arcgis_query(client, base_url, returnIdsOnly="true")
+    except Exception as e:
+        logger.warning("returnIdsOnly failed, falling back to offset paging: %s", str(e))
+        return []
+    return sorted(payload.get("objectIds") or [])
+
+def page_requests(object_ids: List[int], total_count: int, page_size: int) -> List[Dict[str, Any]]:
+    """
+    Query parameters for every page: explicit objectIds chunks when the IDs
+    are known (stable under concurrent fetching), else resultOffset windows.
+    """
+    if object_ids:
+        return [
+            {"objectIds": ",".join(str(oid) for oid in object_ids[start:start + page_size])}
+            for start in range(0, len(object_ids), page_size)
+        ]
+    return [
+        {"resultOffset": offset, "resultRecordCount": page_size}
+        for offset in range(0, total_count, page_size)
+    ]
+
+async def fetch_page(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, base_url: str,
+                     page_params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Fetch one page of features. The semaphore slot is held until the caller
+    has stored the page (see fetch_and_store_data), and released here only on failure.
+    """
+    await semaphore.acquire()
+    try:
+        payload = await arcgis_query(
+            client, base_url, outFields="*", returnGeometry="true", outSR="4326", **page_params
+        )
+    except BaseException:
+        semaphore.release()
+        raise
+    return payload.get("features", [])
+
+def features_to_rows(features_list: List[Dict[str, Any]], geometry_type: str) -> List[Dict[str, Any]]:
+    """Convert ArcGIS JSON features into column dicts with WKT geometry."""
+    features = []
+
+    # Determine ArcGIS geometry type (Polyline, Point, Polygon, etc.)
+    arcgis_geom_type = geometry_type.replace('esriGeometry', '').lower()
+
+    for feature in features_list:
+        geom = feature.get('geometry', {})
+        attrs = feature.get('attributes', {})
+
+        # Convert ArcGIS geometry to WKT
+        wkt = None
+        if arcgis_geom_type == 'polyline' and 'paths' in geom:
+            # For simplicity, just use the first path
+            path = geom['paths'][0]
+            # Build a standard WKT LINESTRING
+            coords = ", ".join(f"{p[0]} {p[1]}" for p in path)
+            wkt = f"LINESTRING({coords})"
+
+        elif arcgis_geom_type == 'point' and 'x' in geom and 'y' in geom:
+            wkt = f"POINT({geom['x']} {geom['y']})"
+
+        elif arcgis_geom_type == 'polygon' and 'rings' in geom:
+            # For simplicity, use the first ring
+            ring = geom['rings'][0]
+            coords = ", ".join(f"{p[0]} {p[1]}" for p in ring)
+            wkt = f"POLYGON(({coords}))"
+
+        else:
+            logger.warning("Unsupported geometry type for feature: %s", feature)
+            continue
+
+        # Build a dict of columns => values
+        feature_data = {
+            "objectid": attrs.get("OBJECTID") or attrs.get("objectid"),
+            "geometry": wkt,  # We'll pass the raw WKT string
+        }
+
+        # Copy over all other attributes, lowercasing keys
+        # but skip the geometry columns to avoid collisions
+        for field_name, value in attrs.items():
+            lname = field_name.lower()
+            if lname not in ("objectid", "shape"):
+                if lname.endswith("date"):
+                    value = convert_timestamp(value)
+                # store everything else
+                feature_data[lname] = value
+
+        features.append(feature_data)
+
+    return features
+
+def feature_columns(features: List[Dict[str, Any]]) -> List[str]:
+    """Union of the features' keys, in first-seen order."""
+    columns: Dict[str, None] = {}
+    for feat in features:
+        columns.update(dict.fromkeys(feat))
+    return list(columns)
+
+def feature_hash(feature: Dict[str, Any]) -> str:
+    """Digest of a feature's attributes and geometry, used to skip unchanged rows on upsert."""
+    return hashlib.md5(orjson.dumps(feature, default=str, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def upsert_clause(table_name: str, columns: List[str]) -> str:
+    """
+    ON CONFLICT (objectid) update that only rewrites rows whose feature hash
+    changed; unchanged rows are left untouched (no new tuple, no WAL).
+    """
+    assignments = [f"{quote(col)} = EXCLUDED.{quote(col)}" for col in columns if col != "objectid"]
+    return (
+        f"ON CONFLICT (objectid) DO UPDATE SET {', '.join(assignments)} "
+        f"WHERE {table_name}.feature_hash IS DISTINCT FROM EXCLUDED.feature_hash"
+    )
+
+async def prepare_upsert_table(db: AsyncSession, table_name: str) -> None:
+    """
+    Make a dataset table upsertable: add the feature_hash column and a unique
+    index on objectid.
+
+    Tables loaded with plain INSERTs before upserts existed can hold several
+    rows per objectid. This one-time migration keeps the most recently
+    inserted row of each objectid (highest `id`) and deletes the others. A
+    table without an `id` column can't tell which row is current, so the job
+    fails instead and the duplicates must be removed by hand (or the table
+    dropped and the dataset re-registered) before ingesting again.
+    """
+    await db.execute(text(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS feature_hash TEXT"))
+    has_unique = (await db.execute(text("""
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = CAST(:table_name AS regclass)
+          AND i.indisunique AND i.indnatts = 1 AND a.attname = 'objectid'
+    """), {"table_name": table_name})).first()
+    if not has_unique:
+        duplicates = (await db.execute(text(
+            f"SELECT COUNT(objectid) - COUNT(DISTINCT objectid) FROM {table_name}"
+        ))).scalar()
+        if duplicates:
+            if "id" not in await table_column_types(db, table_name):
+                await db.rollback()
+                _column_types.pop(table_name, None)
+                logger.error("%s has %d duplicate objectid rows and no id column", table_name, duplicates)
+                raise ValueError(
+                    f"{table_name} has {duplicates} duplicate objectid rows and no id column to pick the "
+                    "current one; remove the duplicates before ingesting"
+                )
+            deleted = await db.execute(text(f"""
+                DELETE FROM {table_name} a USING {table_name} b
+                WHERE a.objectid = b.objectid AND a.id < b.id
+            """))
+            logger.warning(
+                "Removed %d duplicate rows from %s, keeping the newest row per objectid",
+                deleted.rowcount, table_name
+            )
+        await db.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table_name}_objectid ON {table_name} (objectid)"
+        ))
+    await db.commit()
+    _column_types.pop(table_name, None)
+
+async def insert_features(db: AsyncSession, table_name: str, features: List[Dict[str, Any]]) -> List[int]:
+    """
+    Row-by-row load: one parameterized upsert per new or changed feature via executemany.
+    Returns the object IDs of inserted or changed rows.
+    """
+    # Build the INSERT statement with named placeholders
+    columns = feature_columns(features) + ["feature_hash"]
+
+    insert_cols = []
+    insert_vals = []
+    for col in columns:
+        insert_cols.append(col)
+        # Geometry arrives as WKT
+        insert_vals.append("ST_GeomFromText(:geometry, 4326)" if col == "geometry" else f":{col}")
+
+    insert_sql = text(f"""
+    INSERT INTO {table_name} ({", ".join(insert_cols)})
+    VALUES ({", ".join(insert_vals)})
+    {upsert_clause(table_name, columns)}
+    """)
+    logger.debug("Using SQL:\n%s", insert_sql)
+
+    # executemany can't return rows: compare against the stored hashes up front
+    # and send only new or changed features
+    existing = dict((await db.execute(
+        text(f"SELECT objectid, feature_hash FROM {table_name} WHERE objectid = ANY(:object_ids)"),
+        {"object_ids": [feat["objectid"] for feat in features]}
+    )).all())
+    rows = {}
+    for feat in features:
+        digest = feature_hash(feat)
+        if existing.get(feat["objectid"]) != digest:
+            rows[feat["objectid"]] = {**{col: feat.get(col) for col in columns}, "feature_hash": digest}
+
+    if rows:
+        await db.execute(insert_sql, list(rows.values()))
+    await db.commit()
+    return list(rows)
+
+# Column name -> SQL type of ingested tables, looked up once per table
+_column_types: Dict[str, Dict[str, str]] = {}
+
+async def table_column_types(db: AsyncSession, table_name: str) -> Dict[str, str]:
+    if table_name not in _column_types:
+        result = await db.execute(text("""
+            SELECT attname, format_type(atttypid, atttypmod)
+            FROM pg_attribute
+            WHERE attrelid = CAST(:table_name AS regclass) AND attnum > 0 AND NOT attisdropped
+        """), {"table_name": table_name})
+        _column_types[table_name] = {name: sql_type for name, sql_type in result.all()}
+    return _column_types[table_name]
+
+def quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+# Length-limited character types, e.g. "character varying(50)" or "character(3)[]"
+_BOUNDED_CHARACTER_TYPE = re.compile(r"^(character varying|character)\(\d+\)")
+
+def staging_cast_type(sql_type: str) -> str:
+    """
+    Type to CAST a staging column to before inserting it. An explicit cast to
+    varchar(n)/char(n) silently truncates, so those are cast to text and left
+    to the INSERT's assignment cast, which rejects over-long values like the
+    executemany path does.
+    """
+    return _BOUNDED_CHARACTER_TYPE.sub("text", sql_type)
+
+def copy_value(value: Any) -> Optional[str]:
+    """Text form of an attribute for the all-text staging table."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return orjson.dumps(value).decode()
+    return str(value)
+
+async def copy_features(db: AsyncSession, table_name: str, features: List[Dict[str, Any]]) -> List[int]:
+    """
+    Bulk load: COPY the page into a text-typed temp staging table with asyncpg
+    `copy_records_to_table`, then upsert it into the target with one
+    INSERT ... SELECT that casts each column to its target type and builds
+    geometry from WKT. Returns the object IDs of inserted or changed rows.
+    """
+    column_types = await table_column_types(db, table_name)
+    columns = [col for col in feature_columns(features) if col in column_types]
+    skipped = set(feature_columns(features)) - set(columns)
+    if skipped:
+        logger.warning("Skipping attributes without a column in %s: %s", table_name, sorted(skipped))
+    columns.append("feature_hash")
+
+    staging = f"_staging_{table_name}"
+    await db.execute(text(
+        f'CREATE TEMP TABLE {staging} ({", ".join(f"{quote(col)} text" for col in columns)}) ON COMMIT DROP'
+    ))
+
+    # COPY through the asyncpg connection underneath the session's transaction
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        staging,
+        records=[
+            tuple(copy_value(feat.get(col)) for col in columns[:-1]) + (feature_hash(feat),)
+            for feat in features
+        ],
+        columns=columns,
+    )
+
+    select_exprs = [
+        f"ST_GeomFromText({quote(col)}, 4326)" if col == "geometry"
+        else f"CAST({quote(col)} AS {staging_cast_type(column_types[col])})"
+        for col in columns
+    ]
+    # DISTINCT ON: a single upsert can't touch the same objectid twice
+    result = await db.execute(text(
+        f'INSERT INTO {table_name} ({", ".join(quote(col) for col in columns)}) '
+        f'SELECT DISTINCT ON (objectid) {", ".join(select_exprs)} FROM {staging} ORDER BY objectid '
+        f'{upsert_clause(table_name, columns)} '
+        f'RETURNING objectid'
+    ))
+    changed = list(result.scalars().all())
+    await db.commit()
+    return changed
+
+async def store_features(db: AsyncSession, table_name: str, features: List[Dict[str, Any]]) -> int:
+    """
+    Upsert a page of features into Postgres and invalidate the Redis layer
+    hashes if any row changed. Returns the number of changed rows.
+
+    The hashes are deleted rather than patched: a hash that was evicted or
+    flushed would otherwise be recreated holding only the changed rows and
+    served as the whole dataset. GET /datasets/{table_name}/data reloads the
+    complete table from Postgres on the next miss.
+    """
+    if INGESTION_LOAD_METHOD == "copy":
+        changed_ids = await copy_features(db, table_name, features)
+    else:
+        changed_ids = await insert_features(db, table_name, features)
+    if not changed_ids:
+        return 0
+
+    await invalidate_layer_hashes(table_name)
+    return len(changed_ids)
+
+async def invalidate_layer_hashes(table_name: str) -> None:
+    """Drop a table's cached layer hashes and mark its precomputed layer blobs as stale."""
+    await redis_client.delete(f"{table_name}:all", f"{table_name}:geom")
+    await bump_table_version(table_name)
+
+async def delete_missing_features(db: AsyncSession, table_name: str, object_ids: List[int]) -> int:
+    """
+    After a complete fetch, delete rows whose objectid is no longer in the
+    layer and invalidate the Redis layer hashes. Returns the number of deleted rows.
+    """
+    result = await db.execute(
+        text(f"DELETE FROM {table_name} WHERE objectid <> ALL(:object_ids) RETURNING objectid"),
+        {"object_ids": list(object_ids)}
+    )
+    deleted = [str(obj_id) for obj_id in result.scalars().all()]
+    await db.commit()
+    if not deleted:
+        return 0
+
+    await invalidate_layer_hashes(table_name)
+    logger.info("Deleted %d features removed upstream from %s", len(deleted), table_name)
+    return len(deleted)
+
+def progress_percent(stored: int, total: int) -> float:
+    return round(min(stored / total * 100, 100.0), 1) if total else 100.0
+
+def _job_key(table_name: str) -> str:
+    return f"ingestion_job:{table_name}"
+
+async def get_ingestion_job(table_name: str) -> Optional[Dict[str, str]]:
+    """Persisted state of a table's ingestion job, or None if it never ran."""
+    job = await redis_client.hgetall(_job_key(table_name))
+    return job or None
+
+async def update_ingestion_job(table_name: str, **fields) -> None:
+    """
+    Persist job state and mirror it to the `{table}:ingestion_*` keys read by
+    GET /datasets/{table_name}/status.
+    """
+    now = datetime.utcnow().isoformat()
+    fields["updated_at"] = now
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hset(_job_key(table_name), mapping={key: str(value) for key, value in fields.items()})
+    if "status" in fields:
+        pipe.set(f"{table_name}:ingestion_status", fields["status"])
+    if "progress" in fields:
+        pipe.set(f"{table_name}:ingestion_progress", str(fields["progress"]))
+    if "error" in fields:
+        pipe.set(f"{table_name}:ingestion_error", fields["error"])
+    pipe.set(f"{table_name}:last_update", now)
+    await pipe.execute()
+
+def page_checkpoint(page_params: Dict[str, Any], page_size: int) -> int:
+    """Checkpoint after a page: its last object ID, or the offset that follows it."""
+    if "objectIds" in page_params:
+        return int(page_params["objectIds"].rsplit(",", 1)[-1])
+    return page_params["resultOffset"] + page_size
+
+async def _indexed(index: int, page: Awaitable[List[Dict[str, Any]]]) -> Tuple[int, List[Dict[str, Any]]]:
+    return index, await page
+
+# Tables with an ingestion job running in this process
+_active_jobs: Set[str] = set()
+# References to jobs resumed at startup so they aren't garbage collected
+_resumed_tasks: Set[asyncio.Task] = set()
+
+async def fetch_and_store_data(config: Dict[str, Any], resume: bool = False) -> None:
+    """
+    Fetch and store data from ArcGIS REST endpoint in the background.
+
+    Asks the layer for its feature count and object IDs first, then fetches
+    pages concurrently (ARCGIS_PAGE_CONCURRENCY at a time) and writes each
+    page to Postgres and Redis as soon as it arrives.
+
+    Progress is checkpointed in Redis (`ingestion_job:{table}`) after every
+    page. The checkpoint is the last object ID (or offset) below which all
+    pages are committed. With `resume=True` only pages past the checkpoint
+    are fetched.
+
+    Features are upserted on objectid and only rows whose feature hash
+    changed are rewritten, so running the job again (a refresh) is
+    idempotent and touches only the delta. Once every page is stored, rows
+    whose objectid the layer no longer returns are deleted.
+    """
+    table_name = config['table_name']
+    page_size = config['max_record_count']
+    if table_name in _active_jobs:
+        logger.info("Ingestion of %s is already running", table_name)
+        return
+    _active_jobs.add(table_name)
+
+    job = await get_ingestion_job(table_name) if resume else None
+    checkpoint = int(job.get("checkpoint", 0)) if job else 0
+    checkpoint_start = checkpoint
+    logger.info("[1] Starting data fetch and store. Table: %s, resume: %s, checkpoint: %d", table_name, resume, checkpoint)
+    logger.debug("[2] Config details: %s", json.dumps(config, indent=2, default=str))
+
+    try:
+        # Own session: the job outlives the request that started it
+        async with AsyncSessionLocal() as db, httpx.AsyncClient(timeout=ARCGIS_REQUEST_TIMEOUT) as client:
+            total_count = await fetch_feature_count(client, config['base_url'])
+            object_ids = await fetch_object_ids(client, config['base_url'])
+
+            await prepare_upsert_table(db, table_name)
+            changed = 0
+            # Object IDs seen in offset mode; only complete when the run started at offset 0
+            seen_ids: Set[int] = set()
+            if object_ids:
+                mode = "object_ids"
+                # Everything up to the checkpoint is committed; later pages are refetched and
+                # upserted, which rewrites only features that changed upstream
+                stored = sum(1 for oid in object_ids if oid <= checkpoint)
+                remaining = [oid for oid in object_ids if oid > checkpoint]
+                pages = page_requests(remaining, 0, page_size)
+            else:
+                mode = "offset"
+                stored = min(checkpoint, total_count)
+                pages = [
+                    {"resultOffset": offset, "resultRecordCount": page_size}
+                    for offset in range(checkpoint, total_count, page_size)
+                ]
+            logger.info("[3] %d features, %d stored, %d pages of %d to fetch", total_count, stored, len(pages), page_size)
+
+            await update_ingestion_job(
+                table_name, status="in_progress", mode=mode, total_count=total_count, stored_count=stored,
+                changed_count=changed, deleted_count=0, checkpoint=checkpoint,
+                progress=progress_percent(stored, total_count), error=""
+            )
+
+            semaphore = asyncio.Semaphore(ARCGIS_PAGE_CONCURRENCY)
+            tasks = [
+                asyncio.create_task(_indexed(index, fetch_page(client, semaphore, config['base_url'], page)))
+                for index, page in enumerate(pages)
+            ]
+
+            try:
+                completed: Set[int] = set()
+                next_index = 0
+                for next_page in asyncio.as_completed(tasks):
+                    index, features_list = await next_page
+                    try:
+                        features = features_to_rows(features_list, config['geometry_type'])
+                        seen_ids.update(feat['objectid'] for feat in features)
+                        if features:
+                            changed += await store_features(db, table_name, features)
+                            stored += len(features)
+                    finally:
+                        # Let the next page download only once this one is written
+                        semaphore.release()
+
+                    # Advance the checkpoint over the contiguous run of committed pages
+                    completed.add(index)
+                    while next_index in completed:
+                        next_index += 1
+                    if next_index:
+                        checkpoint = page_checkpoint(pages[next_index - 1], page_size)
+                    await update_ingestion_job(
+                        table_name, stored_count=stored, changed_count=changed, checkpoint=checkpoint,
+                        progress=progress_percent(stored, total_count)
+                    )
+                    logger.info("[8] Stored %d/%d features (%d inserted or changed)", stored, total_count, changed)
+            finally:
+                # Stop outstanding downloads before the HTTP client closes
+                for task in tasks:
+                    task.cancel()
+
+            # Every page is stored: drop features deleted upstream. An offset run resumed
+            # past 0 never saw the earlier pages, so it can't tell what was deleted.
+            live_ids = object_ids or (seen_ids if checkpoint_start == 0 else None)
+            deleted = await delete_missing_features(db, table_name, live_ids) if live_ids else 0
+
+        # No more data, ingestion is complete
+        await update_ingestion_job(
+            table_name, status="complete", stored_count=stored, deleted_count=deleted, progress=100
+        )
+        logger.info("<==fetch_and_store_data [20]==> Redis: Ingestion complete")
+
+    except Exception as e:
+        logger.error("[19] Error in fetch_and_store_data: %s", str(e), exc_info=True)
+        try:
+            await update_ingestion_job(table_name, status="failed", error=str(e))
+        except Exception:
+            logger.error("Could not record failed ingestion of %s", table_name)
+        raise Exception(f"Failed to fetch and store data: {str(e)}")
+    finally:
+        _active_jobs.discard(table_name)
+
+async def _run_resumed(config: Dict[str, Any]) -> None:
+    try:
+        await fetch_and_store_data(config, resume=True)
+    except Exception:
+        # Already logged and recorded as failed on the job
+        pass
+
+async def resume_ingestion_jobs() -> None:
+    """Restart jobs left in progress by a crash or restart, from their checkpoints."""
+    async with AsyncSessionLocal() as db:
+        async for key in redis_client.scan_iter(match="ingestion_job:*"):
+            table_name = key.split(":", 1)[1]
+            if await redis_client.hget(key, "status") != "in_progress" or table_name in _active_jobs:
+                continue
+            config = await get_dataset_config(db, table_name)
+            if not config:
+                continue
+            logger.info("Resuming ingestion of %s", table_name)
+            task = asyncio.create_task(_run_resumed(config))
+            _resumed_tasks.add(task)
+            task.add_done_callback(_resumed_tasks.discard)
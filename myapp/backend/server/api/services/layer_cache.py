@@ -0,0 +1,134 @@
+import os
+import gzip
+import hashlib
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+import brotli
+from fastapi import HTTPException, Request, Response
+
+from ..db.redis_connection import redis_binary_client
+
+logger = logging.getLogger(__name__)
+
+LAYER_BLOB_GZIP_LEVEL = int(os.getenv("LAYER_BLOB_GZIP_LEVEL", 6))
+LAYER_BLOB_BROTLI_QUALITY = int(os.getenv("LAYER_BLOB_BROTLI_QUALITY", 5))
+
+def _blob_key(layer: str) -> str:
+    return f"layer_blob:{layer}"
+
+def _compress(payload: bytes) -> Dict[str, bytes]:
+    """Build every stored representation of a serialized layer."""
+    return {
+        "identity": payload,
+        "gzip": gzip.compress(payload, compresslevel=LAYER_BLOB_GZIP_LEVEL),
+        "br": brotli.compress(payload, quality=LAYER_BLOB_BROTLI_QUALITY),
+    }
+
+# Small fields read on every request; the encoded bodies are fetched only when sent
+_BLOB_META_FIELDS = ("etag", "version", "media_type")
+
+async def get_layer_blob(layer: str, table_name: str) -> Tuple[Optional[Dict[str, bytes]], int]:
+    """
+    Fetch the metadata of a layer's precomputed blob together with the current table version.
+
+    Returns (blob, version). The blob holds only `etag`, `version`,
+    `media_type` and `layer`; `layer_blob_response` fetches the one encoding
+    it sends, so a 304 never moves the layer body out of Redis. The blob is
+    None when it is missing or was built from an older version of the table;
+    callers should rebuild it using the returned version so a concurrent
+    ingestion is never masked.
+    """
+    pipe = redis_binary_client.pipeline(transaction=False)
+    pipe.get(f"table_version:{table_name}")
+    pipe.hmget(_blob_key(layer), _BLOB_META_FIELDS)
+    version, meta = await pipe.execute()
+
+    version = int(version) if version else 0
+    blob = dict(zip(_BLOB_META_FIELDS, meta))
+    if blob["etag"] is None or int(blob["version"] or -1) != version:
+        return None, version
+
+    blob["layer"] = layer.encode()
+    return blob, version
+
+async def store_layer_blob(
+    layer: str,
+    payload: bytes,
+    version: int,
+    media_type: str = "application/json"
+) -> Dict[str, bytes]:
+    """
+    Store the serialized body of a layer (JSON by default) plus gzip and brotli variants.
+
+    `version` must be the table version read *before* the data was loaded.
+    """
+    # Compression of a full layer is CPU heavy, keep it off the event loop
+    blob = await asyncio.to_thread(_compress, payload)
+    blob["etag"] = hashlib.sha256(payload).hexdigest()[:32].encode()
+    blob["version"] = str(version).encode()
+    blob["media_type"] = media_type.encode()
+
+    await redis_binary_client.hset(_blob_key(layer), mapping=blob)
+    blob["layer"] = layer.encode()
+    logger.info(
+        "Stored layer blob %s v%d (identity=%d, gzip=%d, br=%d bytes)",
+        layer, version, len(blob["identity"]), len(blob["gzip"]), len(blob["br"])
+    )
+    return blob
+
+def _accepted_encodings(request: Request) -> set:
+    header = request.headers.get("accept-encoding", "")
+    return {part.split(";")[0].strip().lower() for part in header.split(",") if part.strip()}
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Compare an If-None-Match header against the blob's base ETag (any encoding variant)."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        tag = tag.removeprefix("W/").strip('"')
+        if tag.split("-")[0] == etag:
+            return True
+    return False
+
+async def layer_blob_response(request: Request, blob: Dict[str, bytes], vary: str = "Accept-Encoding") -> Response:
+    """
+    Serve a precomputed layer blob, honouring Accept-Encoding and If-None-Match.
+
+    A 304 is answered from the blob metadata alone; otherwise only the chosen
+    encoding is read from Redis (unless `blob` already carries it).
+
+    Endpoints that also pick the blob from the Accept header must pass
+    `vary="Accept, Accept-Encoding"` so shared caches keep the variants apart.
+    """
+    accepted = _accepted_encodings(request)
+    encoding = "br" if "br" in accepted else "gzip" if "gzip" in accepted else None
+    etag = blob["etag"].decode()
+
+    if_none_match = request.headers.get("if-none-match")
+    not_modified = bool(if_none_match) and _etag_matches(if_none_match, etag)
+
+    body = blob.get(encoding or "identity")
+    if body is None and not not_modified:
+        # Read the body with its ETag so a concurrent rebuild can't pair new bytes with an old tag
+        body, current_etag = await redis_binary_client.hmget(
+            _blob_key(blob["layer"].decode()), [encoding or "identity", "etag"]
+        )
+        if body is None:
+            raise HTTPException(status_code=503, detail="Layer cache is being rebuilt, retry shortly")
+        etag = current_etag.decode()
+
+    headers = {
+        "ETag": f'"{etag}-{encoding}"' if encoding else f'"{etag}"',
+        "Vary": vary,
+        "Cache-Control": "no-cache",
+    }
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    media_type = (blob.get("media_type") or b"application/json").decode()
+    return Response(content=body, media_type=media_type, headers=headers)
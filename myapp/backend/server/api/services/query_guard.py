@@ -0,0 +1,104 @@
+import os
+import hashlib
+import logging
+from typing import Dict, Any, List, Optional
+
+import orjson
+from sqlalchemy import text
+
+from ..db.redis_connection import redis_client
+from .result_cache import canonicalize_sql
+
+logger = logging.getLogger(__name__)
+
+# Planner estimates above either threshold are rejected; 0 disables that check
+SQL_MAX_PLAN_COST = float(os.getenv("SQL_MAX_PLAN_COST", 5_000_000))
+SQL_MAX_PLAN_ROWS = float(os.getenv("SQL_MAX_PLAN_ROWS", 5_000_000))
+SQL_PLAN_CACHE_TTL = int(os.getenv("SQL_PLAN_CACHE_TTL", 3600))  # seconds
+
+TOO_EXPENSIVE = "too_expensive"
+
+# Function scans that only produce values; any other function may read tables the plan doesn't name
+_PURE_FUNCTION_SCANS = {"generate_series", "unnest"}
+
+def sql_fingerprint(sql_query: str) -> str:
+    return hashlib.sha1(canonicalize_sql(sql_query).encode()).hexdigest()
+
+def evaluate_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Compare the top plan node's estimates with the configured limits."""
+    total_cost = float(plan.get("Total Cost", 0))
+    plan_rows = float(plan.get("Plan Rows", 0))
+
+    reasons = []
+    if SQL_MAX_PLAN_COST and total_cost > SQL_MAX_PLAN_COST:
+        reasons.append(f"estimated cost {total_cost:,.0f} exceeds {SQL_MAX_PLAN_COST:,.0f}")
+    if SQL_MAX_PLAN_ROWS and plan_rows > SQL_MAX_PLAN_ROWS:
+        reasons.append(f"estimated {plan_rows:,.0f} rows exceeds {SQL_MAX_PLAN_ROWS:,.0f}")
+
+    return {
+        "allowed": not reasons,
+        "total_cost": total_cost,
+        "plan_rows": plan_rows,
+        "detail": "; ".join(reasons),
+    }
+
+def plan_tables(plan: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Every relation scanned anywhere in the plan tree (CTEs, subqueries and
+    joins included), sorted and de-duplicated. Returns None when the tables a
+    result depends on cannot be fully resolved, e.g. a set-returning function
+    that may query tables itself.
+    """
+    tables = set()
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if node.get("Relation Name"):
+            tables.add(node["Relation Name"].lower())
+        if node.get("Node Type") == "Function Scan" and node.get("Function Name") not in _PURE_FUNCTION_SCANS:
+            return None
+        nodes.extend(node.get("Plans", []))
+    return sorted(tables)
+
+def _plan_key(sql_query: str) -> str:
+    return f"sql_plan_guard:{sql_fingerprint(sql_query)}"
+
+async def get_cached_plan(sql_query: str) -> Optional[Dict[str, Any]]:
+    """The cached plan decision for a statement, if it was explained recently."""
+    cached = await redis_client.get(_plan_key(sql_query))
+    return orjson.loads(cached) if cached is not None else None
+
+async def get_query_plan(conn, sql_query: str) -> Dict[str, Any]:
+    """
+    EXPLAIN (FORMAT JSON) the statement on the given connection and return the
+    cost decision plus the tables it reads (`tables`, None if unresolvable).
+    Decisions are cached per SQL fingerprint for SQL_PLAN_CACHE_TTL seconds.
+    """
+    decision = await get_cached_plan(sql_query)
+    if decision is not None and "tables" in decision:
+        return decision
+
+    explain = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql_query.strip().rstrip(';')}"))).scalar()
+    if isinstance(explain, (str, bytes)):
+        explain = orjson.loads(explain)
+    decision = evaluate_plan(explain[0]["Plan"])
+    decision["tables"] = plan_tables(explain[0]["Plan"])
+    await redis_client.set(_plan_key(sql_query), orjson.dumps(decision), ex=SQL_PLAN_CACHE_TTL)
+    return decision
+
+def query_rejection(sql_query: str, decision: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Structured "too expensive" error for a rejected plan decision, else None."""
+    if decision["allowed"]:
+        return None
+
+    logger.warning(f"Rejected expensive SQL ({decision['detail']}): {canonicalize_sql(sql_query)[:200]}")
+    return {
+        "error": f"This query is too expensive to run ({decision['detail']})",
+        "reason": TOO_EXPENSIVE,
+        "plan": {
+            "total_cost": decision["total_cost"],
+            "plan_rows": decision["plan_rows"],
+            "max_cost": SQL_MAX_PLAN_COST,
+            "max_rows": SQL_MAX_PLAN_ROWS,
+        },
+    }
@@ -0,0 +1,94 @@
+import os
+import re
+import time
+import zlib
+import hashlib
+import logging
+from typing import Dict, Any, List, Optional
+
+import orjson
+
+from ..db.redis_connection import redis_binary_client
+from ..utils.streaming import json_default
+
+logger = logging.getLogger(__name__)
+
+SQL_RESULT_CACHE_TTL = int(os.getenv("SQL_RESULT_CACHE_TTL", 3600))  # seconds
+SQL_RESULT_CACHE_MAX_ENTRIES = int(os.getenv("SQL_RESULT_CACHE_MAX_ENTRIES", 1000))
+SQL_RESULT_CACHE_MAX_BYTES = int(os.getenv("SQL_RESULT_CACHE_MAX_BYTES", 1024 * 1024))  # per compressed result
+
+LRU_KEY = "sql_result_cache:lru"
+
+# Results of these can change without a table version bump
+_VOLATILE = re.compile(r"\b(now|random|current_date|current_timestamp|clock_timestamp)\b", re.IGNORECASE)
+UNVERSIONED_TABLES = {"chat_messages", "chat_sessions", "dataset_configs"}
+
+def canonicalize_sql(sql: str) -> str:
+    """Collapse whitespace and drop trailing semicolons so trivially different statements share a key."""
+    return " ".join(sql.split()).rstrip(";").strip()
+
+def is_cacheable_sql(sql: str, tables: Optional[List[str]]) -> bool:
+    """
+    `tables` comes from the statement's EXPLAIN plan (query_guard.plan_tables);
+    None means the plan could not be fully resolved, so the result is not cached.
+    """
+    return bool(tables) and not _VOLATILE.search(sql) and not UNVERSIONED_TABLES.intersection(tables)
+
+async def result_cache_key(sql_query: str, tables: Optional[List[str]]) -> Optional[str]:
+    """
+    Key on the canonical SQL plus the current version of every referenced
+    table, or None when the statement is not cacheable.
+
+    Read it before executing the statement and store the result under that
+    key: a change committed while the statement runs bumps a version, so the
+    result lands under the older key and is never served as current.
+    """
+    sql = canonicalize_sql(sql_query)
+    if not is_cacheable_sql(sql, tables):
+        return None
+
+    versions = await redis_binary_client.mget([f"table_version:{table}" for table in tables])
+    version_tag = ",".join(
+        f"{table}={int(version) if version else 0}" for table, version in zip(tables, versions)
+    )
+    digest = hashlib.sha1(f"{sql}|{version_tag}".encode()).hexdigest()
+    return f"sql_result_cache:{digest}"
+
+async def get_cached_result(key: str) -> Optional[Dict[str, Any]]:
+    """Return the cached result stored under a `result_cache_key`, if any."""
+    payload = await redis_binary_client.get(key)
+    if payload is None:
+        return None
+
+    # Record the access for LRU eviction
+    await redis_binary_client.zadd(LRU_KEY, {key: time.time()})
+    logger.info("SQL result cache hit (%d bytes)", len(payload))
+    return orjson.loads(zlib.decompress(payload))
+
+async def store_cached_result(key: Optional[str], query_result: Dict[str, Any]) -> None:
+    """
+    Store a compressed query result under a `result_cache_key` read before
+    the statement ran, skipping oversized ones, and evict the least recently
+    used entries beyond SQL_RESULT_CACHE_MAX_ENTRIES. A None key (not
+    cacheable) stores nothing.
+    """
+    if key is None or "error" in query_result:
+        return
+
+    payload = zlib.compress(orjson.dumps(query_result, default=json_default))
+    if len(payload) > SQL_RESULT_CACHE_MAX_BYTES:
+        logger.info("SQL result too large to cache (%d bytes)", len(payload))
+        return
+
+    pipe = redis_binary_client.pipeline(transaction=False)
+    pipe.setex(key, SQL_RESULT_CACHE_TTL, payload)
+    pipe.zadd(LRU_KEY, {key: time.time()})
+    pipe.zcard(LRU_KEY)
+    entry_count = (await pipe.execute())[-1]
+
+    overflow = entry_count - SQL_RESULT_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        evicted = [member for member, _score in await redis_binary_client.zpopmin(LRU_KEY, overflow)]
+        if evicted:
+            await redis_binary_client.delete(*evicted)
+            logger.info("Evicted %d least recently used SQL results", len(evicted))
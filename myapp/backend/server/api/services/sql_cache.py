@@ -0,0 +1,146 @@
+import os
+import re
+import hashlib
+import logging
+from typing import Dict, Any, Optional
+
+from ..db.redis_connection import redis_client
+
+logger = logging.getLogger(__name__)
+
+SQL_CACHE_TTL = int(os.getenv("SQL_CACHE_TTL", 86400))  # seconds
+# Jaccard similarity on question word sets for near-duplicate hits; 0 disables it.
+# Lower settings are raised to the floor, since a few changed words can invert a question.
+SQL_CACHE_MIN_SIMILARITY = 0.9
+SQL_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("SQL_CACHE_SIMILARITY_THRESHOLD", 0))
+if 0 < SQL_CACHE_SIMILARITY_THRESHOLD < SQL_CACHE_MIN_SIMILARITY:
+    SQL_CACHE_SIMILARITY_THRESHOLD = SQL_CACHE_MIN_SIMILARITY
+SQL_CACHE_MAX_INDEX_SIZE = int(os.getenv("SQL_CACHE_MAX_INDEX_SIZE", 5000))
+
+SCHEMA_VERSION_KEY = "sql_cache:schema_version"
+STATS_KEY = "sql_cache:stats"
+
+# Questions that refer back to earlier turns depend on chat history, not only on their text.
+# "it", "that" and "this" are left out: they mostly appear as relative pronouns or
+# determiners ("pipes that are older than 1950") in self-contained questions.
+_CONTEXT_REFERENCE = re.compile(
+    r"\b(those|these|them|they|previous|same|above|earlier|again)\b"
+)
+
+# Words that flip or bound a question's meaning; similar questions must agree on them
+_NEGATION_WORDS = {
+    "not", "no", "none", "never", "without", "except", "excluding", "exclude", "nor",
+    "isn", "aren", "wasn", "weren", "don", "doesn", "didn", "hasn", "haven", "t",
+}
+_NUMBER = re.compile(r"^\d+$")
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+def is_cacheable_question(question: str) -> bool:
+    """Skip caching for questions whose meaning depends on the conversation."""
+    return _CONTEXT_REFERENCE.search(normalize_question(question)) is None
+
+def _jaccard(a: str, b: str) -> float:
+    """
+    Word-set similarity of two normalized questions. Pairs that differ in any
+    negation word or number ("not cast iron", "top 5" vs "top 10") score 0 so
+    a reworded question never reuses SQL with the opposite or a different filter.
+    """
+    words_a, words_b = set(a.split()), set(b.split())
+    if not words_a or not words_b:
+        return 0.0
+    differing = words_a ^ words_b
+    if differing & _NEGATION_WORDS or any(_NUMBER.match(word) for word in differing):
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+async def get_schema_version() -> int:
+    version = await redis_client.get(SCHEMA_VERSION_KEY)
+    return int(version) if version else 0
+
+async def bump_schema_version() -> int:
+    """Invalidate every cached SQL statement, e.g. after a dataset is registered."""
+    version = await redis_client.incr(SCHEMA_VERSION_KEY)
+    logger.info(f"SQL cache schema version bumped to {version}")
+    return version
+
+async def _namespace(db_schema: str) -> str:
+    """Cache namespace for the current schema text and registered-dataset version."""
+    schema_hash = hashlib.sha1(db_schema.encode()).hexdigest()[:12]
+    return f"sql_cache:v{await get_schema_version()}:{schema_hash}"
+
+def _question_hash(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+async def get_cached_sql(question: str, db_schema: str) -> Optional[str]:
+    """
+    Look up previously generated SQL for a question: exact match on the
+    normalized text first, then (if enabled) the most similar cached question.
+    """
+    if not is_cacheable_question(question):
+        return None
+
+    normalized = normalize_question(question)
+    namespace = await _namespace(db_schema)
+
+    sql = await redis_client.get(f"{namespace}:q:{_question_hash(normalized)}")
+    if sql:
+        await redis_client.hincrby(STATS_KEY, "hits", 1)
+        logger.info(f"SQL cache hit for: {normalized}")
+        return sql
+
+    if SQL_CACHE_SIMILARITY_THRESHOLD > 0:
+        best_hash, best_score = None, 0.0
+        for cached_hash, cached_question in (await redis_client.hgetall(f"{namespace}:index")).items():
+            score = _jaccard(normalized, cached_question)
+            if score > best_score:
+                best_hash, best_score = cached_hash, score
+        if best_hash and best_score >= SQL_CACHE_SIMILARITY_THRESHOLD:
+            sql = await redis_client.get(f"{namespace}:q:{best_hash}")
+            if sql:
+                await redis_client.hincrby(STATS_KEY, "similar_hits", 1)
+                logger.info(f"SQL cache similar hit ({best_score:.2f}) for: {normalized}")
+                return sql
+
+    await redis_client.hincrby(STATS_KEY, "misses", 1)
+    return None
+
+async def store_cached_sql(question: str, db_schema: str, sql: str) -> None:
+    """Cache generated SQL for a question under the current schema version."""
+    if not sql or not is_cacheable_question(question):
+        return
+
+    normalized = normalize_question(question)
+    namespace = await _namespace(db_schema)
+    question_hash = _question_hash(normalized)
+
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.setex(f"{namespace}:q:{question_hash}", SQL_CACHE_TTL, sql)
+    if SQL_CACHE_SIMILARITY_THRESHOLD > 0:
+        pipe.hlen(f"{namespace}:index")
+    pipe.hincrby(STATS_KEY, "stores", 1)
+    results = await pipe.execute()
+
+    # The similarity index is only grown while it stays small enough to scan
+    if SQL_CACHE_SIMILARITY_THRESHOLD > 0 and results[1] < SQL_CACHE_MAX_INDEX_SIZE:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hset(f"{namespace}:index", question_hash, normalized)
+        pipe.expire(f"{namespace}:index", SQL_CACHE_TTL)
+        await pipe.execute()
+
+async def get_sql_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and hit rate of the NL->SQL cache."""
+    stats = {key: int(value) for key, value in (await redis_client.hgetall(STATS_KEY)).items()}
+    hits = stats.get("hits", 0) + stats.get("similar_hits", 0)
+    lookups = hits + stats.get("misses", 0)
+    return {
+        "hits": stats.get("hits", 0),
+        "similar_hits": stats.get("similar_hits", 0),
+        "misses": stats.get("misses", 0),
+        "stores": stats.get("stores", 0),
+        "hit_rate": hits / lookups if lookups else 0.0,
+        "schema_version": await get_schema_version(),
+    }
@@ -1,16 +1,38 @@
 from sqlalchemy import text
-from sqlalchemy.ext.asyncio import AsyncSession
+import os
 import logging
 from typing import Dict, Any, List
 
+from ..db.session import engine, read_engine, READ_REPLICA_MAX_LAG
+from ..db.redis_connection import tables_changed_within
+from .result_cache import result_cache_key, get_cached_result, store_cached_result
+from .query_guard import get_cached_plan, get_query_plan, query_rejection
+
 logger = logging.getLogger(__name__)
 
-async def execute_sql_query(db: AsyncSession, sql_query: str) -> Dict[str, Any]:
+SQL_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", 15000))
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", 10000))
+SQL_FETCH_CHUNK_SIZE = int(os.getenv("SQL_FETCH_CHUNK_SIZE", 1000))
+
+async def replica_may_lag(tables) -> bool:
+    """True when a replica is configured and one of `tables` changed within READ_REPLICA_MAX_LAG."""
+    return read_engine is not engine and await tables_changed_within(tables, READ_REPLICA_MAX_LAG)
+
+async def execute_sql_query(sql_query: str) -> Dict[str, Any]:
     """
-    Executes a SQL query and returns the results
+    Executes a SQL query and returns the results.
+    Results are served from / stored in the SQL result cache, keyed by the
+    canonical statement and the versions of the tables its EXPLAIN plan reads.
+
+    The statement runs on its own read-replica connection (the primary when
+    no replica is configured, or when a table it reads changed within
+    READ_REPLICA_MAX_LAG seconds) in a READ ONLY transaction with
+    a statement_timeout. Plans over the cost limits in query_guard are
+    rejected before execution; otherwise rows are fetched through a
+    server-side cursor and at most SQL_MAX_ROWS are returned. When the cap is hit, the true row count
+    is computed separately and reported as `total_count`.
     
     Args:
-        db: The database session
         sql_query: The SQL query to execute
         
     Returns:
@@ -24,24 +46,68 @@ async def execute_sql_query(db: AsyncSession, sql_query: str) -> Dict[str, Any]:
                 logger.warning(f"Potentially harmful SQL detected: {sql_query}")
                 return {"error": "This query type is not allowed"}
         
-        # Execute the query
-        result = await db.execute(text(sql_query))
-        rows = result.fetchall()
+        # The tables a statement reads are only known once it has been explained
+        plan = await get_cached_plan(sql_query)
+        tables = plan.get("tables") if plan is not None else None
+        cache_key = await result_cache_key(sql_query, tables)
+        if cache_key is not None:
+            cached_result = await get_cached_result(cache_key)
+            if cached_result is not None:
+                return cached_result
+
+        source = engine if await replica_may_lag(tables) else read_engine
+        async with source.connect() as conn:
+            async with conn.begin():
+                await conn.execute(text("SET TRANSACTION READ ONLY"))
+                await conn.execute(text(f"SET LOCAL statement_timeout = {SQL_STATEMENT_TIMEOUT_MS}"))
+
+                plan = await get_query_plan(conn, sql_query)
+                rejection = query_rejection(sql_query, plan)
+                if rejection is not None:
+                    return rejection
+
+                # Key on the table versions from before the statement runs
+                cache_key = await result_cache_key(sql_query, plan["tables"])
+
+                # Stream through a server-side cursor, stopping just past the row cap
+                result = await conn.stream(text(sql_query))
+                columns = list(result.keys())
+                rows: List[Any] = []
+                async for partition in result.partitions(SQL_FETCH_CHUNK_SIZE):
+                    rows.extend(partition)
+                    if len(rows) > SQL_MAX_ROWS:
+                        break
+                await result.close()
+
+                truncated = len(rows) > SQL_MAX_ROWS
+                rows = rows[:SQL_MAX_ROWS]
+                total_count = len(rows)
+                if truncated:
+                    count_sql = f"SELECT COUNT(*) FROM ({sql_query.strip().rstrip(';')}) AS capped_query"
+                    total_count = (await conn.execute(text(count_sql))).scalar()
+
+        # A replica read of a just-changed table may predate the change; never cache it
+        # under the new table version
+        if source is read_engine and await replica_may_lag(plan["tables"]):
+            cache_key = None
         
         # Convert to dict format
         if not rows:
+            await store_cached_result(cache_key, {"result": "No data found"})
             return {"result": "No data found"}
         
-        # Get column names
-        columns = result.keys()
-        
         # Convert to list of dicts
         data = [dict(zip(columns, row)) for row in rows]
-        logger.info(f"================================================")
-        logger.info(f"Query results:\n{data}")
-        logger.info(f"================================================")
-        return {"result": data}
+        logger.info(
+            f"Query returned {len(data)} rows (total {total_count}{', truncated' if truncated else ''}), "
+            f"columns: {columns}"
+        )
+        query_result = {"result": data, "total_count": total_count, "truncated": truncated}
+        await store_cached_result(cache_key, query_result)
+        return query_result
     
     except Exception as e:
         logger.error(f"Error executing SQL query: {str(e)}")
-        return {"error": str(e)}
\ No newline at end of file
+        if "statement timeout" in str(e):
+            return {"error": f"The query took longer than {SQL_STATEMENT_TIMEOUT_MS / 1000:g} seconds and was cancelled"}
+        return {"error": str(e)}
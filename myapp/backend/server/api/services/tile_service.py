@@ -0,0 +1,132 @@
+import os
+import re
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Collection
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.redis_connection import redis_binary_client, get_table_version
+from .ingestion import table_column_types
+
+logger = logging.getLogger(__name__)
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+TILE_MAX_ZOOM = int(os.getenv("TILE_MAX_ZOOM", 22))
+TILE_LRU_SIZE = int(os.getenv("TILE_LRU_SIZE", 2048))
+TILE_REDIS_TTL = int(os.getenv("TILE_REDIS_TTL", 86400))  # seconds
+
+# Attribute columns exposed in the water_mains tiles
+WATERMAIN_TILE_COLUMNS = ["object_id", "material", "status", "pressure_zone", "pipe_size"]
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+class TileLRUCache:
+    """Small in-process LRU of encoded tiles, keyed by table version and tile coordinates."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._tiles: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+        return tile
+
+    def set(self, key: str, tile: bytes) -> None:
+        self._tiles[key] = tile
+        self._tiles.move_to_end(key)
+        while len(self._tiles) > self.max_size:
+            self._tiles.popitem(last=False)
+
+tile_lru = TileLRUCache(TILE_LRU_SIZE)
+
+def is_valid_tile(z: int, x: int, y: int) -> bool:
+    """Check that z/x/y address an existing tile in the XYZ scheme."""
+    if z < 0 or z > TILE_MAX_ZOOM:
+        return False
+    limit = 2 ** z
+    return 0 <= x < limit and 0 <= y < limit
+
+def tile_columns(table_name: str, config: Optional[Dict[str, Any]], available: Collection[str]) -> list:
+    """
+    Attribute columns to include as MVT feature properties.
+    Registered datasets expose objectid plus their ArcGIS display field.
+
+    Only columns in `available` (the table's real columns) are kept: a display
+    field the ingestion never created would otherwise fail every tile.
+    """
+    if table_name == "water_mains":
+        wanted = WATERMAIN_TILE_COLUMNS
+    else:
+        wanted = ["objectid"]
+        display_field = (config or {}).get("display_field")
+        if display_field and _IDENTIFIER.match(display_field.lower()) and display_field.lower() != "objectid":
+            wanted.append(display_field.lower())
+
+    columns = [col for col in wanted if col in available]
+    if len(columns) < len(wanted):
+        logger.warning("Tile columns missing from %s: %s", table_name, sorted(set(wanted) - set(columns)))
+    return columns
+
+def build_tile_sql(table_name: str, columns: list) -> str:
+    """
+    Build the ST_AsMVT query for one tile. The `&&` filter runs against the
+    table's native SRID so the GiST index on geometry is used.
+
+    Dataset tables are created from unquoted DDL, so their names are folded to
+    lower case by Postgres; the table is referenced unquoted to fold the same way.
+    """
+    if not _IDENTIFIER.match(table_name):
+        raise ValueError(f"Invalid table name: {table_name}")
+    select_cols = "".join(f', t."{col}"' for col in columns)
+    return f"""
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(:z, :x, :y) AS geom
+        ),
+        mvtgeom AS (
+            SELECT
+                ST_AsMVTGeom(ST_Transform(t.geometry, 3857), bounds.geom, {TILE_EXTENT}, {TILE_BUFFER}, true) AS geom{select_cols}
+            FROM {table_name} t, bounds
+            WHERE t.geometry && ST_Transform(bounds.geom, 4326)
+        )
+        SELECT ST_AsMVT(mvtgeom.*, :layer, {TILE_EXTENT}, 'geom') FROM mvtgeom
+    """
+
+async def get_tile(
+    db: AsyncSession,
+    table_name: str,
+    config: Optional[Dict[str, Any]],
+    z: int,
+    x: int,
+    y: int
+) -> bytes:
+    """
+    Return the encoded vector tile for a table, checking the in-process LRU,
+    then Redis, then rendering it in PostGIS. Cache keys include the table
+    version so ingestion and scraper updates invalidate old tiles.
+    """
+    version = await get_table_version(table_name)
+    key = f"tile:{table_name}:{version}:{z}/{x}/{y}"
+
+    tile = tile_lru.get(key)
+    if tile is not None:
+        return tile
+
+    tile = await redis_binary_client.get(key)
+    if tile is not None:
+        tile_lru.set(key, tile)
+        return tile
+
+    columns = tile_columns(table_name, config, await table_column_types(db, table_name))
+    sql = build_tile_sql(table_name, columns)
+    result = await db.execute(text(sql), {"z": z, "x": x, "y": y, "layer": table_name})
+    tile = bytes(result.scalar() or b"")
+
+    await redis_binary_client.setex(key, TILE_REDIS_TTL, tile)
+    tile_lru.set(key, tile)
+    logger.debug("Rendered tile %s (%d bytes)", key, len(tile))
+    return tile
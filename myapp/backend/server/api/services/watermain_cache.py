@@ -0,0 +1,200 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import func
+from redis.exceptions import WatchError
+
+from ..db.session import engine
+from ..db.models import WaterMain
+from ..db.redis_connection import redis_client, redis_binary_client, get_table_version
+from ..utils.geometry_encoding import TWKB_PRECISION, TWKB_MEDIA_TYPE, pack_twkb_records
+from .layer_cache import store_layer_blob
+
+logger = logging.getLogger(__name__)
+
+# Bulk preload tuning (rows streamed from Postgres / HSETs per Redis pipeline)
+PRELOAD_CHUNK_SIZE = int(os.getenv("REDIS_PRELOAD_CHUNK_SIZE", 5000))
+
+# Hashes served by the /watermains/cached endpoints, and the table version they were built from.
+# WKT lives only inside the `watermains:all` records; the geometry-only projection is TWKB.
+WATERMAIN_HASHES = ("watermains:all", "watermains:geom:twkb")
+# WKT projection kept by earlier releases, dropped on the next rebuild
+RETIRED_HASHES = ("watermains:geom",)
+CACHE_VERSION_KEY = "watermains:cache_version"
+
+# One rebuild at a time across workers and pods (Redis lock) and per worker (asyncio lock)
+REBUILD_LOCK_KEY = "watermains:rebuild_lock"
+WATERMAIN_REBUILD_LOCK_TTL = int(os.getenv("WATERMAIN_REBUILD_LOCK_TTL", 600))  # seconds
+REBUILD_WAIT_INTERVAL = 0.5  # seconds between checks while another worker rebuilds
+_rebuild_lock = asyncio.Lock()
+
+def serialize_watermain(wm) -> dict:
+    """Convert a watermain row mapping into the dict cached in Redis."""
+    return {
+        "id": wm["id"],
+        "city": wm["city"],
+        "dataset_type": wm["dataset_type"],
+        "object_id": wm["object_id"],
+        "watmain_id": wm["watmain_id"],
+        "status": wm["status"],
+        "pressure_zone": wm["pressure_zone"],
+        "material": wm["material"],
+        "condition_score": float(wm["condition_score"]) if wm["condition_score"] else None,
+        "shape_length": float(wm["shape_length"]) if wm["shape_length"] else None,
+        "geometry": wm["geometry"],
+        "created_at": wm["created_at"].isoformat() if wm["created_at"] else None,
+        "updated_at": wm["updated_at"].isoformat() if wm["updated_at"] else None,
+    }
+
+async def _release_rebuild_lock(token: str) -> None:
+    """Delete the rebuild lock only if this run still holds it."""
+    async with redis_client.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(REBUILD_LOCK_KEY)
+            if await pipe.get(REBUILD_LOCK_KEY) == token:
+                pipe.multi()
+                pipe.delete(REBUILD_LOCK_KEY)
+                await pipe.execute()
+            else:
+                await pipe.unwatch()
+        except WatchError:
+            # The lock expired and was taken by another rebuild meanwhile
+            pass
+
+async def _wait_for_rebuild() -> None:
+    """Wait until the rebuild running in another worker releases (or times out) its lock."""
+    deadline = time.monotonic() + WATERMAIN_REBUILD_LOCK_TTL
+    while await redis_client.exists(REBUILD_LOCK_KEY) and time.monotonic() < deadline:
+        await asyncio.sleep(REBUILD_WAIT_INTERVAL)
+
+async def rebuild_watermain_cache() -> int:
+    """
+    Reload the watermain hashes and layer blobs from Postgres; return the row count.
+
+    Only one worker rebuilds at a time (Redis lock `watermains:rebuild_lock`);
+    others wait for it to finish and reuse its result. If the lock outlives
+    WATERMAIN_REBUILD_LOCK_TTL, a second rebuild may start, but every run
+    writes to its own building keys, so one never clobbers the other.
+    """
+    token = uuid.uuid4().hex
+    if not await redis_client.set(REBUILD_LOCK_KEY, token, nx=True, ex=WATERMAIN_REBUILD_LOCK_TTL):
+        logger.info("Watermain cache is being rebuilt by another worker, waiting for it")
+        await _wait_for_rebuild()
+        return await redis_client.hlen("watermains:all")
+    try:
+        return await _load_watermain_cache(token)
+    finally:
+        await _release_rebuild_lock(token)
+
+async def _load_watermain_cache(run_id: str) -> int:
+    """
+    Rows are streamed with a server-side cursor in chunks of PRELOAD_CHUNK_SIZE
+    and written with one pipelined batch of HSETs per chunk into per-run
+    `:building:{run_id}` copies of the hashes, which are renamed over the live
+    ones at the end so readers never see a half-loaded layer and rows deleted
+    in Postgres drop out. The building keys expire in case the worker dies.
+    """
+    start_time = time.perf_counter()
+    total_rows = 0
+    # Read the version before the data so a concurrent update marks the blobs stale
+    version = await get_table_version("water_mains")
+    building = {key: f"{key}:building:{run_id}" for key in WATERMAIN_HASHES}
+    record_fragments = []
+    geometry_fragments = []
+    twkb_fragments = []
+
+    async with AsyncSession(engine) as db:
+        result = await db.stream(
+            select(
+                WaterMain.id,
+                WaterMain.city,
+                WaterMain.dataset_type,
+                WaterMain.object_id,
+                WaterMain.watmain_id,
+                WaterMain.status,
+                WaterMain.pressure_zone,
+                WaterMain.material,
+                WaterMain.condition_score,
+                WaterMain.shape_length,
+                func.ST_AsText(WaterMain.geometry).label("geometry"),
+                func.ST_AsTWKB(WaterMain.geometry, TWKB_PRECISION).label("geometry_twkb"),
+                WaterMain.created_at,
+                WaterMain.updated_at,
+            ).execution_options(yield_per=PRELOAD_CHUNK_SIZE)
+        )
+
+        async for chunk in result.mappings().partitions(PRELOAD_CHUNK_SIZE):
+            # orjson bytes are stored as-is and passed straight through by the cached endpoints
+            records = {str(wm["object_id"]): orjson.dumps(serialize_watermain(wm)) for wm in chunk}
+            # Geometry-only projection so by-ID map lookups don't parse full records
+            twkb_geometries = {
+                str(wm["object_id"]): bytes(wm["geometry_twkb"]) for wm in chunk if wm["geometry_twkb"]
+            }
+
+            if twkb_geometries:
+                await redis_binary_client.hset(building["watermains:geom:twkb"], mapping=twkb_geometries)
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.hset(building["watermains:all"], mapping=records)
+            for building_key in building.values():
+                pipe.expire(building_key, WATERMAIN_REBUILD_LOCK_TTL)
+            await pipe.execute()
+
+            record_fragments.extend(records.values())
+            geometry_fragments.extend(
+                orjson.dumps({"object_id": wm["object_id"], "geometry": wm["geometry"]})
+                for wm in chunk if wm["geometry"]
+            )
+            twkb_fragments.append(pack_twkb_records(twkb_geometries.items()))
+            total_rows += len(chunk)
+            logger.info(f"🔄 Cached {total_rows} watermains so far")
+
+    # Swap the rebuilt hashes in atomically; a hash that ended up empty was never created
+    built = [key for key, building_key in building.items() if await redis_client.exists(building_key)]
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(*WATERMAIN_HASHES, *RETIRED_HASHES)
+    for key in built:
+        pipe.rename(building[key], key)
+        # RENAME keeps the building key's safety TTL
+        pipe.persist(key)
+    pipe.set(CACHE_VERSION_KEY, version)
+    await pipe.execute()
+
+    # Precompute the full-layer responses served by /watermains/cached/ and /cached/geometry
+    await store_layer_blob("watermains:all", b"[" + b",".join(record_fragments) + b"]", version)
+    await store_layer_blob("watermains:geom", b"[" + b",".join(geometry_fragments) + b"]", version)
+    await store_layer_blob("watermains:geom:twkb", b"".join(twkb_fragments), version, TWKB_MEDIA_TYPE)
+
+    elapsed = time.perf_counter() - start_time
+    rate = total_rows / elapsed if elapsed > 0 else float(total_rows)
+    logger.info(
+        f"✅ Cached {total_rows} watermains in Redis at version {version}, including geometry "
+        f"({elapsed:.2f}s, {rate:,.0f} rows/sec)"
+    )
+    return total_rows
+
+async def refresh_stale_watermain_cache(version: int) -> bool:
+    """
+    Rebuild the watermain cache from Postgres if it predates table `version`.
+
+    The scraper only bumps `table_version:water_mains`, so hashes loaded before
+    that bump must not be used to rebuild the layer blobs. Returns True when a
+    rebuild happened (the blobs are then current for `version`).
+    """
+    cached_version = await redis_client.get(CACHE_VERSION_KEY)
+    if cached_version is not None and int(cached_version) >= version:
+        return False
+
+    async with _rebuild_lock:
+        # Another request may have rebuilt it while we waited
+        cached_version = await redis_client.get(CACHE_VERSION_KEY)
+        if cached_version is not None and int(cached_version) >= version:
+            return True
+        logger.info(f"♻️ Watermain cache is older than table version {version}, reloading from Postgres")
+        await rebuild_watermain_cache()
+        return True
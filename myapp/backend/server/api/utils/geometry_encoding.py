@@ -0,0 +1,35 @@
+import os
+import struct
+from typing import Iterable, Optional, Tuple
+
+from fastapi import Request
+
+# TWKB (Tiny WKB) with coordinates quantized to TWKB_PRECISION decimal places
+# (6 decimals of a degree is roughly 0.1 m)
+TWKB_PRECISION = int(os.getenv("TWKB_PRECISION", 6))
+TWKB_MEDIA_TYPE = "application/vnd.webgis.twkb"
+
+# Allowed values for the `format` query parameter of geometry endpoints
+GEOMETRY_FORMAT_PATTERN = "^(wkt|twkb)$"
+
+_RECORD_HEADER = struct.Struct("<II")
+
+# Vary header for geometry responses negotiated through Accept (see `wants_twkb`)
+GEOMETRY_VARY = "Accept, Accept-Encoding"
+
+def wants_twkb(request: Request, format: Optional[str]) -> bool:
+    """
+    Decide whether a geometry response should be TWKB: an explicit `format`
+    parameter wins, otherwise the Accept header is consulted.
+    """
+    if format:
+        return format == "twkb"
+    return TWKB_MEDIA_TYPE in request.headers.get("accept", "")
+
+def pack_twkb_record(object_id: int, geometry: bytes) -> bytes:
+    """Frame one geometry as <uint32 object_id><uint32 length><TWKB bytes> (little-endian)."""
+    return _RECORD_HEADER.pack(int(object_id), len(geometry)) + geometry
+
+def pack_twkb_records(records: Iterable[Tuple[int, bytes]]) -> bytes:
+    """Concatenate framed TWKB records into one response body."""
+    return b"".join(pack_twkb_record(object_id, geometry) for object_id, geometry in records if geometry)
@@ -1,18 +1,83 @@
 import os
+import asyncio
+import random
 import openai
-from openai import OpenAI
-from openai import BadRequestError, RateLimitError, APIError, APITimeoutError
-from typing import Dict, Any, Optional, List
+from openai import AsyncOpenAI
+from openai import (
+    BadRequestError, RateLimitError, APIError, APITimeoutError, APIConnectionError, InternalServerError
+)
+from typing import Dict, Any, Optional, List, AsyncIterator
 import logging
 import re
 
 logger = logging.getLogger(__name__)
 api_key = os.getenv("OPENAI_API_KEY")
 
-# Initialize the OpenAI client with the API key
-client = OpenAI(api_key=api_key)
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 30))  # seconds per call
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 8))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 3))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", 0.5))  # seconds
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", 8))  # seconds
 
-def generate_sql_from_query(user_query: str, db_schema: str, chat_history: Optional[str] = None) -> str:
+# Initialize the async OpenAI client with the API key; retries are handled below
+client = AsyncOpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT, max_retries=0)
+
+# Bounds the number of in-flight completions per worker
+_openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+# Transient failures worth retrying
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+async def create_chat_completion(timeout: float = OPENAI_TIMEOUT, **kwargs):
+    """
+    Create a chat completion without blocking the event loop.
+
+    Calls are limited to OPENAI_MAX_CONCURRENCY at a time and transient errors
+    are retried up to OPENAI_MAX_RETRIES times with full-jitter exponential backoff.
+    The semaphore is released while backing off.
+    """
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        try:
+            async with _openai_semaphore:
+                return await client.chat.completions.create(timeout=timeout, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt >= OPENAI_MAX_RETRIES:
+                raise
+            delay = random.uniform(0, min(OPENAI_RETRY_MAX_DELAY, OPENAI_RETRY_BASE_DELAY * (2 ** attempt)))
+            logger.warning(
+                f"OpenAI call failed ({type(e).__name__}), retrying in {delay:.2f}s "
+                f"(attempt {attempt + 1}/{OPENAI_MAX_RETRIES})"
+            )
+            await asyncio.sleep(delay)
+
+async def stream_chat_completion(timeout: float = OPENAI_TIMEOUT, **kwargs) -> AsyncIterator[str]:
+    """
+    Stream the content deltas of a chat completion.
+
+    Shares the concurrency cap with create_chat_completion and holds it while
+    streaming. Transient errors are retried only before the first token.
+    """
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        started = False
+        try:
+            async with _openai_semaphore:
+                stream = await client.chat.completions.create(timeout=timeout, stream=True, **kwargs)
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        started = True
+                        yield chunk.choices[0].delta.content
+            return
+        except RETRYABLE_ERRORS as e:
+            if started or attempt >= OPENAI_MAX_RETRIES:
+                raise
+            delay = random.uniform(0, min(OPENAI_RETRY_MAX_DELAY, OPENAI_RETRY_BASE_DELAY * (2 ** attempt)))
+            logger.warning(
+                f"OpenAI stream failed ({type(e).__name__}), retrying in {delay:.2f}s "
+                f"(attempt {attempt + 1}/{OPENAI_MAX_RETRIES})"
+            )
+            await asyncio.sleep(delay)
+
+async def generate_sql_from_query(user_query: str, db_schema: str, chat_history: Optional[str] = None) -> str:
     """
     Uses OpenAI to convert a natural language query to SQL
     
@@ -86,7 +151,7 @@ def generate_sql_from_query(user_query: str, db_schema: str, chat_history: Optio
         """
 
     try:
-        response = client.chat.completions.create(
+        response = await create_chat_completion(
             model="gpt-4o-mini",  # or "gpt-3.5-turbo" if GPT-4 is unavailable
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -131,7 +196,43 @@ def generate_sql_from_query(user_query: str, db_schema: str, chat_history: Optio
         return ""
 
 
-def generate_response(query_result: Dict[str, Any], user_query: str, chat_history: Optional[str] = None) -> str:
+def _response_request(query_result: Dict[str, Any], user_query: str, chat_history: Optional[str] = None) -> Dict[str, Any]:
+    """Completion arguments for explaining a query result."""
+    result_str = str(query_result)
+    
+    # Add chat history context if available
+    history_context = ""
+    if chat_history and chat_history.strip():
+        history_context = f"""
+        Previous conversation history:
+        {chat_history}
+        
+        Use this conversation history for context when generating your response.
+        If the user is referring to previous questions or topics, maintain that context.
+        """
+
+    prompt = f"""
+    Given this query result: {result_str}
+
+    And the original question: "{user_query}"
+    
+    {history_context}
+
+    Generate a friendly and informative response that answers the question.
+    Note: If there is a list of any kind, make sure that each item in the list is on a new line.
+    """
+
+    return dict(
+        model="gpt-4o-mini",  # Use GPT-4 if desired/available
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant that explains data in a friendly way. Do not include any special characters like asterisks (**) in your responses."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+        max_tokens=5000
+    )
+
+async def generate_response(query_result: Dict[str, Any], user_query: str, chat_history: Optional[str] = None) -> str:
     """
     Generates a natural language response based on query results
     
@@ -144,39 +245,7 @@ def generate_response(query_result: Dict[str, Any], user_query: str, chat_histor
         A natural language response explaining the data or any errors.
     """
     try:
-        result_str = str(query_result)
-        
-        # Add chat history context if available
-        history_context = ""
-        if chat_history and chat_history.strip():
-            history_context = f"""
-            Previous conversation history:
-            {chat_history}
-            
-            Use this conversation history for context when generating your response.
-            If the user is referring to previous questions or topics, maintain that context.
-            """
-
-        prompt = f"""
-        Given this query result: {result_str}
-
-        And the original question: "{user_query}"
-        
-        {history_context}
-
-        Generate a friendly and informative response that answers the question.
-        Note: If there is a list of any kind, make sure that each item in the list is on a new line.
-        """
-
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Use GPT-4 if desired/available
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that explains data in a friendly way. Do not include any special characters like asterisks (**) in your responses."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=5000
-        )
+        response = await create_chat_completion(**_response_request(query_result, user_query, chat_history))
 
         friendly_response = response.choices[0].message.content.strip()
         logger.info(f"================================================")
@@ -197,7 +266,44 @@ def generate_response(query_result: Dict[str, Any], user_query: str, chat_histor
         return f"I found this result: {query_result}"
 
 
-def generate_map_update_response(count: int, user_query: str, chat_history: Optional[str] = None) -> str:
+def _map_update_request(count: int, user_query: str, chat_history: Optional[str] = None) -> Dict[str, Any]:
+    """Completion arguments for announcing a map filter."""
+    # Add chat history context if available
+    history_context = ""
+    if chat_history and chat_history.strip():
+        history_context = f"""
+        Previous conversation history:
+        {chat_history}
+        
+        Use this conversation history for context when generating your response.
+        """
+        
+    prompt = f"""
+    The user asked: "{user_query}"
+    
+    {history_context}
+    
+    This was a request to filter and display water mains on the map.
+    I found {count} water mains matching these criteria.
+    
+    Create a friendly response that:
+    1. Acknowledges the request to show certain water mains
+    2. Mentions that {count} features are now being displayed on the map
+    3. Suggests the user can click on individual water mains for more details
+    4. Keep it concise but friendly
+    """
+
+    return dict(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant for a GIS application."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+        max_tokens=150  # Short response is sufficient
+    )
+
+async def generate_map_update_response(count: int, user_query: str, chat_history: Optional[str] = None) -> str:
     """
     Generates a simpler response for 'show' queries without sending the full list of IDs
     
@@ -210,40 +316,7 @@ def generate_map_update_response(count: int, user_query: str, chat_history: Opti
         A natural language response about the map update
     """
     try:
-        # Add chat history context if available
-        history_context = ""
-        if chat_history and chat_history.strip():
-            history_context = f"""
-            Previous conversation history:
-            {chat_history}
-            
-            Use this conversation history for context when generating your response.
-            """
-            
-        prompt = f"""
-        The user asked: "{user_query}"
-        
-        {history_context}
-        
-        This was a request to filter and display water mains on the map.
-        I found {count} water mains matching these criteria.
-        
-        Create a friendly response that:
-        1. Acknowledges the request to show certain water mains
-        2. Mentions that {count} features are now being displayed on the map
-        3. Suggests the user can click on individual water mains for more details
-        4. Keep it concise but friendly
-        """
-
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant for a GIS application."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=150  # Short response is sufficient
-        )
+        response = await create_chat_completion(**_map_update_request(count, user_query, chat_history))
 
         friendly_response = response.choices[0].message.content.strip()
         logger.info(f"Map update response:\n{friendly_response}")
@@ -255,3 +328,27 @@ def generate_map_update_response(count: int, user_query: str, chat_history: Opti
         return f"I've updated the map to show {count} water mains matching your criteria. You can click on any highlighted feature for more details."
 
 
+async def stream_response(query_result: Dict[str, Any], user_query: str, chat_history: Optional[str] = None) -> AsyncIterator[str]:
+    """Streaming variant of generate_response, yielding the answer as it is generated."""
+    started = False
+    try:
+        async for token in stream_chat_completion(**_response_request(query_result, user_query, chat_history)):
+            started = True
+            yield token
+    except Exception as e:
+        logger.error(f"Error streaming response: {str(e)}")
+        if not started:
+            yield "I'm sorry, but I couldn't retrieve the data at this time."
+
+
+async def stream_map_update_response(count: int, user_query: str, chat_history: Optional[str] = None) -> AsyncIterator[str]:
+    """Streaming variant of generate_map_update_response."""
+    started = False
+    try:
+        async for token in stream_chat_completion(**_map_update_request(count, user_query, chat_history)):
+            started = True
+            yield token
+    except Exception as e:
+        logger.error(f"Error streaming map update response: {str(e)}")
+        if not started:
+            yield f"I've updated the map to show {count} water mains matching your criteria. You can click on any highlighted feature for more details."
@@ -0,0 +1,98 @@
+import os
+import orjson
+import logging
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, Optional, Union
+
+from fastapi.responses import StreamingResponse
+from shapely import wkt as shapely_wkt
+from shapely.geometry import mapping
+
+from ..db.session import ReadSessionLocal
+from ..db.redis_connection import redis_client
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 1000))
+
+# Allowed values for the `format` query parameter of streamable list endpoints
+STREAM_FORMAT_PATTERN = "^(ndjson|geojson)$"
+
+Record = Union[str, Dict[str, Any]]
+
+def json_default(value: Any) -> Any:
+    """orjson fallback: numeric columns (Decimal) stay numbers, anything else becomes its text form."""
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+def _dumps(record: Record) -> str:
+    """Serialize a record, passing through records that are already JSON text."""
+    return record if isinstance(record, str) else orjson.dumps(record, default=json_default).decode()
+
+def wkt_to_geojson(geometry_wkt: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Convert a WKT string into a GeoJSON geometry dict."""
+    if not geometry_wkt:
+        return None
+    return mapping(shapely_wkt.loads(geometry_wkt))
+
+def record_to_feature(record: Record, id_field: str) -> Dict[str, Any]:
+    """Turn a flat record with a WKT `geometry` field into a GeoJSON Feature."""
+    properties = orjson.loads(record) if isinstance(record, str) else dict(record)
+    geometry = properties.pop("geometry", None)
+    return {
+        "type": "Feature",
+        "id": properties.get(id_field),
+        "geometry": wkt_to_geojson(geometry),
+        "properties": properties,
+    }
+
+async def iter_hash_values(key: str, count: int = STREAM_CHUNK_SIZE) -> AsyncIterator[str]:
+    """Yield the values of a Redis hash incrementally with HSCAN."""
+    async for _field, value in redis_client.hscan_iter(key, count=count):
+        yield value
+
+async def iter_query_rows(statement, params: Optional[Dict[str, Any]] = None,
+                          chunk_size: int = STREAM_CHUNK_SIZE,
+                          session_factory=None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield rows of a query as dicts through a server-side cursor.
+
+    Opens its own read-replica session (or one from `session_factory`) because
+    a streamed body outlives the request's `get_db` dependency scope.
+    """
+    async with (session_factory or ReadSessionLocal)() as db:
+        result = await db.stream(statement, params, execution_options={"yield_per": chunk_size})
+        async for chunk in result.mappings().partitions(chunk_size):
+            for row in chunk:
+                yield dict(row)
+
+async def ndjson_lines(records: AsyncIterator[Record]) -> AsyncIterator[str]:
+    """Stream records as newline-delimited JSON."""
+    async for record in records:
+        yield _dumps(record) + "\n"
+
+async def json_array(records: AsyncIterator[Record]) -> AsyncIterator[str]:
+    """Stream records as a single JSON array without materializing it."""
+    yield "["
+    first = True
+    async for record in records:
+        yield _dumps(record) if first else "," + _dumps(record)
+        first = False
+    yield "]"
+
+async def geojson_feature_collection(records: AsyncIterator[Record], id_field: str) -> AsyncIterator[str]:
+    """Stream records as a GeoJSON FeatureCollection."""
+    yield '{"type": "FeatureCollection", "features": ['
+    first = True
+    async for record in records:
+        feature = orjson.dumps(record_to_feature(record, id_field), default=json_default).decode()
+        yield feature if first else "," + feature
+        first = False
+    yield "]}"
+
+def streaming_records_response(records: AsyncIterator[Record], fmt: str, id_field: str) -> StreamingResponse:
+    """Wrap a record iterator in a StreamingResponse for the requested format."""
+    if fmt == "geojson":
+        return StreamingResponse(geojson_feature_collection(records, id_field), media_type="application/geo+json")
+    return StreamingResponse(ndjson_lines(records), media_type="application/x-ndjson")
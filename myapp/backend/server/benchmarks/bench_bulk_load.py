@@ -0,0 +1,97 @@
+"""
+Benchmark: executemany upsert vs. COPY + set-based upsert for dataset ingestion.
+
+Creates a scratch PostGIS table shaped like an ingested ArcGIS point layer,
+then loads the same synthetic features through `insert_features` (a feature_hash
+lookup, then one parameterized upsert executemany'd over the page) and `copy_features` (asyncpg
+`copy_records_to_table` into a staging table, then a single INSERT ... SELECT
+... ON CONFLICT), in pages of `--page-size` like the ingestion job does. A
+final run reloads the same features with COPY to time a refresh where nothing
+changed. Needs DATABASE_URL to point at PostGIS; run from the server
+directory, e.g. inside the api container:
+
+    python -m benchmarks.bench_bulk_load --features 100000
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from api.db.session import AsyncSessionLocal, dispose_engines
+from api.services.ingestion import insert_features, copy_features, prepare_upsert_table
+
+BENCH_TABLE = "bench_bulk_load"
+
+def make_features(count: int) -> list:
+    """Synthetic features as produced by `features_to_rows` for a point layer."""
+    installed = datetime(1990, 1, 1)
+    return [
+        {
+            "objectid": obj_id,
+            "geometry": f"POINT(-80.{obj_id % 10000:04d} 43.{obj_id % 7919:04d})",
+            "asset_id": f"HYD-{obj_id:07d}",
+            "status": "ACTIVE" if obj_id % 5 else "ABANDONED",
+            "diameter": 150 + obj_id % 4 * 50,
+            "condition_score": round(obj_id % 100 / 10, 1),
+            "installation_date": installed + timedelta(days=obj_id % 10000),
+        }
+        for obj_id in range(1, count + 1)
+    ]
+
+async def reset_table(db) -> None:
+    await db.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+    await db.execute(text(f"""
+        CREATE TABLE {BENCH_TABLE} (
+            id SERIAL PRIMARY KEY,
+            objectid INTEGER,
+            asset_id VARCHAR(50),
+            status VARCHAR(50),
+            diameter INTEGER,
+            condition_score NUMERIC,
+            installation_date TIMESTAMP,
+            geometry GEOMETRY(Point, 4326)
+        )
+    """))
+    await db.commit()
+    # feature_hash column + unique objectid index, as for ingested datasets
+    await prepare_upsert_table(db, BENCH_TABLE)
+
+async def timed_load(load, features: list, page_size: int, fresh: bool = True) -> float:
+    """Load all features page by page, into a fresh table unless `fresh` is False; return seconds."""
+    async with AsyncSessionLocal() as db:
+        if fresh:
+            await reset_table(db)
+        start = time.perf_counter()
+        for offset in range(0, len(features), page_size):
+            await load(db, BENCH_TABLE, features[offset:offset + page_size])
+        elapsed = time.perf_counter() - start
+
+        loaded = (await db.execute(text(f"SELECT COUNT(*) FROM {BENCH_TABLE}"))).scalar()
+        assert loaded == len(features), f"expected {len(features)} rows, found {loaded}"
+        return elapsed
+
+async def main(count: int, page_size: int) -> None:
+    features = make_features(count)
+    try:
+        insert_s = await timed_load(insert_features, features, page_size)
+        copy_s = await timed_load(copy_features, features, page_size)
+        refresh_s = await timed_load(copy_features, features, page_size, fresh=False)
+        print(f"{'method':>10} {'seconds':>9} {'features/s':>11}")
+        print(f"{'insert':>10} {insert_s:>9.2f} {count / insert_s:>11,.0f}")
+        print(f"{'copy':>10} {copy_s:>9.2f} {count / copy_s:>11,.0f}")
+        print(f"{'refresh':>10} {refresh_s:>9.2f} {count / refresh_s:>11,.0f}")
+        print(f"speedup: {insert_s / copy_s:.1f}x")
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+            await db.commit()
+        await dispose_engines()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--features", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.features, args.page_size))
@@ -0,0 +1,64 @@
+"""
+Benchmark: per-ID HGET vs. batched HMGET geometry lookups.
+
+Seeds a scratch Redis hash with synthetic watermain records, then times the
+old lookup (one HGET round trip per object_id) against `hmget_chunked` for
+100 / 1k / 10k IDs. Run from the server directory, e.g. inside the api container:
+
+    python -m benchmarks.bench_geometry_lookup
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from api.db.redis_connection import redis_client, hmget_chunked, close_redis
+
+BENCH_KEY = "bench:watermains:all"
+SAMPLE_GEOMETRY = "LINESTRING(" + ", ".join(f"-80.{i:04d} 43.{i:04d}" for i in range(20)) + ")"
+
+async def seed(count: int) -> None:
+    """Fill the scratch hash with `count` synthetic watermain records."""
+    await redis_client.delete(BENCH_KEY)
+    batch = 5000
+    for start in range(0, count, batch):
+        mapping = {
+            str(obj_id): json.dumps({"object_id": obj_id, "material": "CAST IRON", "geometry": SAMPLE_GEOMETRY})
+            for obj_id in range(start, min(start + batch, count))
+        }
+        await redis_client.hset(BENCH_KEY, mapping=mapping)
+
+async def per_id_hget(ids) -> list:
+    return [await redis_client.hget(BENCH_KEY, str(obj_id)) for obj_id in ids]
+
+async def batched_hmget(ids) -> list:
+    return await hmget_chunked(BENCH_KEY, ids)
+
+async def timed(fn, ids, repeat: int) -> float:
+    """Return the best wall-clock time in milliseconds over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn(ids)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+async def main(sizes, repeat: int) -> None:
+    await seed(max(sizes))
+    try:
+        print(f"{'ids':>8} {'hget (ms)':>12} {'hmget (ms)':>12} {'speedup':>9}")
+        for size in sizes:
+            ids = list(range(size))
+            old = await timed(per_id_hget, ids, repeat)
+            new = await timed(batched_hmget, ids, repeat)
+            print(f"{size:>8} {old:>12.1f} {new:>12.1f} {old / new:>8.1f}x")
+    finally:
+        await redis_client.delete(BENCH_KEY)
+        await close_redis()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.repeat))
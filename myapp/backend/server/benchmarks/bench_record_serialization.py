@@ -0,0 +1,65 @@
+"""
+Benchmark: per-record cost of serving cached watermain records.
+
+Compares, on a synthetic layer (50k records by default):
+  * stdlib  - json.loads each cached record, validate it with WaterMainResponse,
+              then serialize the list again (the previous cache-hit path)
+  * orjson  - orjson.loads / orjson.dumps without model validation
+  * passthrough - join the cached JSON bytes into the response body (the new path)
+
+Pure CPU benchmark, no Redis or Postgres needed:
+
+    python -m benchmarks.bench_record_serialization --records 50000
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+import orjson
+
+from api.schemas.watermains import WaterMainResponse
+
+SAMPLE_GEOMETRY = "LINESTRING(" + ", ".join(f"-80.{i:04d} 43.{i:04d}" for i in range(20)) + ")"
+
+def make_records(count: int) -> list:
+    """Build cached record payloads in the format written by preload_redis."""
+    now = datetime(2024, 1, 1).isoformat()
+    return [
+        orjson.dumps({
+            "id": i, "city": "Kitchener", "dataset_type": "water_mains", "object_id": i,
+            "watmain_id": i, "status": "ACTIVE", "pressure_zone": "4", "material": "CAST IRON",
+            "condition_score": 7.5, "shape_length": 123.4, "geometry": SAMPLE_GEOMETRY,
+            "created_at": now, "updated_at": now,
+        })
+        for i in range(count)
+    ]
+
+def stdlib_validated(records: list) -> bytes:
+    models = [WaterMainResponse.model_validate(json.loads(record)) for record in records]
+    return json.dumps([model.model_dump(mode="json") for model in models]).encode()
+
+def orjson_roundtrip(records: list) -> bytes:
+    return orjson.dumps([orjson.loads(record) for record in records])
+
+def passthrough(records: list) -> bytes:
+    return b"[" + b",".join(records) + b"]"
+
+def main(count: int, repeat: int) -> None:
+    records = make_records(count)
+    print(f"{count} records, best of {repeat}")
+    print(f"{'path':>12} {'total (ms)':>12} {'per record (us)':>16}")
+    for name, fn in (("stdlib", stdlib_validated), ("orjson", orjson_roundtrip), ("passthrough", passthrough)):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn(records)
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:>12} {best * 1000:>12.1f} {best / count * 1e6:>16.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.records, args.repeat)
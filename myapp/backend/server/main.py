@@ -1,19 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 import asyncio
-import json
 import logging
-from sqlalchemy.sql import func  # Import SQL functions for geometry handling
-import os
 from dotenv import load_dotenv
 
-from api.endpoints import watermains, chat, datasets  # Add datasets import
-from api.db.session import engine
+from api.endpoints import watermains, chat, datasets, tiles, system  # Add datasets import
+from api.db.session import engine, dispose_engines
 from api.db import models
-from api.db.models import WaterMain
-from api.db.redis_connection import redis_client
+from api.db.redis_connection import close_redis
+from api.services.watermain_cache import rebuild_watermain_cache
+from api.services.chat_writer import chat_writer
+from api.services.ingestion import resume_ingestion_jobs
 
 app = FastAPI(
     title="WebGIS AI API",
@@ -36,6 +33,8 @@ app.add_middleware(
 app.include_router(watermains.router, prefix="/watermains", tags=["watermains"])
 app.include_router(chat.router, prefix="/chat", tags=["chat"])
 app.include_router(datasets.router, prefix="/datasets", tags=["datasets"])  # Add datasets router
+app.include_router(tiles.router, prefix="/tiles", tags=["tiles"])
+app.include_router(system.router, prefix="/system", tags=["system"])
 
 # Retry Configuration
 MAX_RETRIES = 5
@@ -63,6 +62,8 @@ async def startup_event():
             await conn.run_sync(models.Base.metadata.create_all)
             logger.info("✅ Database tables created successfully")
 
+        chat_writer.start()
+
         # Attempt to preload Redis
         success = await preload_redis()
         if success:
@@ -70,79 +71,56 @@ async def startup_event():
         else:
             logger.warning("⚠️ Application started but Redis preload was unsuccessful")
 
+        # Pick up dataset ingestion jobs interrupted by the last shutdown; runs after the
+        # preload (which retries until Redis and Postgres are up) and can't fail startup
+        try:
+            await resume_ingestion_jobs()
+        except Exception as e:
+            logger.error(f"❌ Could not resume interrupted ingestion jobs: {str(e)}")
+
     except Exception as e:
         logger.error(f"❌ Error during startup: {str(e)}")
 
-# ✅ Fixed Redis Preloading Function
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued chat messages, then release pooled Redis and database connections."""
+    await chat_writer.stop()
+    await close_redis()
+    await dispose_engines()
+
+# ✅ Bulk Redis Preloading Function
 async def preload_redis(retry_count: int = 0) -> bool:
     """
-    Preload Redis with all watermains data on startup, including geometry as WKT.
+    Preload Redis with all watermains data on startup, including geometry as WKT
+    (inside the records) and as compact TWKB (`watermains:geom:twkb`).
+
+    The load itself lives in `rebuild_watermain_cache`, which the cached
+    endpoints also call when the scraper has bumped the table version since
+    the hashes were built.
     Returns True if successful, False otherwise.
     """
     try:
-        async with AsyncSession(engine) as db:
-            # ✅ Convert Geometry to WKT using ST_AsText()
-            result = await db.execute(
-                select(
-                    WaterMain.id,
-                    WaterMain.city,
-                    WaterMain.dataset_type,
-                    WaterMain.object_id,
-                    WaterMain.watmain_id,
-                    WaterMain.status,
-                    WaterMain.pressure_zone,
-                    WaterMain.material,
-                    WaterMain.condition_score,
-                    WaterMain.shape_length,
-                    func.ST_AsText(WaterMain.geometry).label("geometry"),  # Convert geometry to WKT
-                    WaterMain.created_at,
-                    WaterMain.updated_at,
-                )
-            )
-            watermains_list = result.mappings().all()
-            # print(watermains_list)
-
-            logger.info(f"✅ Retrieved {len(watermains_list)} watermains from DB")
-
-            if not watermains_list:
-                delay = min(INITIAL_RETRY_DELAY * (2 ** retry_count), 60)
-                
-                if retry_count < 5:
-                    logger.warning(f"⚠️ No watermains found in DB. Retrying in {delay} seconds... (Attempt {retry_count + 1}/5)")
-                    await asyncio.sleep(delay)
-                    return await preload_redis(retry_count + 1)
-                else:
-                    logger.error("❌ Max retries reached. No watermains data available to cache.")
-                    return False
-
-            # Store each watermain in Redis hash with object_id as field
-            for wm in watermains_list:
-                watermain_data = {
-                    "id": wm["id"],
-                    "city": wm["city"],
-                    "dataset_type": wm["dataset_type"],
-                    "object_id": wm["object_id"],
-                    "watmain_id": wm["watmain_id"],
-                    "status": wm["status"],
-                    "pressure_zone": wm["pressure_zone"],
-                    "material": wm["material"],
-                    "condition_score": float(wm["condition_score"]) if wm["condition_score"] else None,
-                    "shape_length": float(wm["shape_length"]) if wm["shape_length"] else None,
-                    "geometry": wm["geometry"],
-                    "created_at": wm["created_at"].isoformat() if wm["created_at"] else None,
-                    "updated_at": wm["updated_at"].isoformat() if wm["updated_at"] else None,
-                }
-                redis_client.hset("watermains:all", str(wm["object_id"]), json.dumps(watermain_data))
-
-            logger.info(f"✅ Successfully cached {len(watermains_list)} watermains in Redis, including geometry")
-            return True
+        total_rows = await rebuild_watermain_cache()
+
+        if not total_rows:
+            delay = min(INITIAL_RETRY_DELAY * (2 ** retry_count), MAX_RETRY_DELAY)
+
+            if retry_count < MAX_RETRIES:
+                logger.warning(f"⚠️ No watermains found in DB. Retrying in {delay} seconds... (Attempt {retry_count + 1}/{MAX_RETRIES})")
+                await asyncio.sleep(delay)
+                return await preload_redis(retry_count + 1)
+            else:
+                logger.error("❌ Max retries reached. No watermains data available to cache.")
+                return False
+
+        return True
 
     except Exception as e:
         logger.error(f"❌ Error during Redis preload: {str(e)}")
 
-        if retry_count < 5:
-            delay = min(5 * (2 ** retry_count), 60)
-            logger.warning(f"🔄 Retrying in {delay} seconds... (Attempt {retry_count + 1}/5)")
+        if retry_count < MAX_RETRIES:
+            delay = min(INITIAL_RETRY_DELAY * (2 ** retry_count), MAX_RETRY_DELAY)
+            logger.warning(f"🔄 Retrying in {delay} seconds... (Attempt {retry_count + 1}/{MAX_RETRIES})")
             await asyncio.sleep(delay)
             return await preload_redis(retry_count + 1)
 
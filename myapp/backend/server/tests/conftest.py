@@ -0,0 +1,4 @@
+import os
+
+# The OpenAI client is created at import time; tests never call it
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,165 @@
+"""
+Read-replica routing: analytical SQL goes to the replica unless a table it
+reads changed recently, and nothing read from a possibly lagging replica is
+cached under the current table version.
+
+Run from the server directory:  python -m pytest tests
+"""
+import asyncio
+import importlib
+
+import pytest
+
+from api.db import session
+from api.endpoints import datasets
+from api.services import sql_executor
+
+class FakeResult:
+    def keys(self):
+        return ["object_id"]
+
+    async def partitions(self, size):
+        yield [(1,), (2,)]
+
+    async def close(self):
+        pass
+
+class FakeConnection:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def begin(self):
+        return self
+
+    async def execute(self, statement):
+        return None
+
+    async def stream(self, statement):
+        return FakeResult()
+
+class FakeEngine:
+    def __init__(self, name):
+        self.name = name
+        self.connections = 0
+
+    def connect(self):
+        self.connections += 1
+        return FakeConnection()
+
+@pytest.fixture
+def engines(monkeypatch):
+    """Separate fake primary and replica engines with Redis-backed helpers stubbed out."""
+    primary, replica = FakeEngine("primary"), FakeEngine("replica")
+    monkeypatch.setattr(sql_executor, "engine", primary)
+    monkeypatch.setattr(sql_executor, "read_engine", replica)
+
+    plan = {"allowed": True, "tables": ["water_mains"]}
+    stored = []
+
+    async def get_cached_plan(sql_query):
+        return plan
+
+    async def get_query_plan(conn, sql_query):
+        return plan
+
+    async def result_cache_key(sql_query, tables):
+        return f"key:{','.join(tables)}" if tables else None
+
+    async def get_cached_result(key):
+        return None
+
+    async def store_cached_result(key, query_result):
+        stored.append(key)
+
+    monkeypatch.setattr(sql_executor, "get_cached_plan", get_cached_plan)
+    monkeypatch.setattr(sql_executor, "get_query_plan", get_query_plan)
+    monkeypatch.setattr(sql_executor, "result_cache_key", result_cache_key)
+    monkeypatch.setattr(sql_executor, "get_cached_result", get_cached_result)
+    monkeypatch.setattr(sql_executor, "store_cached_result", store_cached_result)
+    return primary, replica, stored
+
+def set_recent_change(monkeypatch, changed):
+    async def tables_changed_within(tables, seconds):
+        return changed
+
+    monkeypatch.setattr(sql_executor, "tables_changed_within", tables_changed_within)
+
+def test_database_read_url_creates_replica_engine(monkeypatch):
+    monkeypatch.delenv("READ_REPLICA_DATABASE_URL", raising=False)
+    monkeypatch.setenv("DATABASE_READ_URL", "postgresql+asyncpg://reader:pw@replica:5432/gis_data")
+    try:
+        importlib.reload(session)
+        assert session.read_engine is not session.engine
+        assert session.read_engine.url.host == "replica"
+        assert session.ReadSessionLocal is not session.AsyncSessionLocal
+    finally:
+        monkeypatch.delenv("DATABASE_READ_URL")
+        importlib.reload(session)
+
+def test_execute_sql_query_reads_from_replica(engines, monkeypatch):
+    primary, replica, stored = engines
+    set_recent_change(monkeypatch, False)
+
+    result = asyncio.run(sql_executor.execute_sql_query("SELECT object_id FROM water_mains"))
+
+    assert result["total_count"] == 2
+    assert (replica.connections, primary.connections) == (1, 0)
+    assert stored == ["key:water_mains"]
+
+def test_execute_sql_query_uses_primary_after_recent_change(engines, monkeypatch):
+    primary, replica, stored = engines
+    set_recent_change(monkeypatch, True)
+
+    asyncio.run(sql_executor.execute_sql_query("SELECT object_id FROM water_mains"))
+
+    assert (replica.connections, primary.connections) == (0, 1)
+    # Primary reads are current, so they are still cached
+    assert stored == ["key:water_mains"]
+
+def test_replica_result_not_cached_when_table_changed_during_query(engines, monkeypatch):
+    primary, replica, stored = engines
+    changes = iter([False, True])
+
+    async def tables_changed_within(tables, seconds):
+        return next(changes)
+
+    monkeypatch.setattr(sql_executor, "tables_changed_within", tables_changed_within)
+
+    asyncio.run(sql_executor.execute_sql_query("SELECT object_id FROM water_mains"))
+
+    assert replica.connections == 1
+    assert stored == [None]
+
+def test_dataset_cache_miss_fills_hash_from_primary(monkeypatch):
+    factories, hashes = [], []
+
+    async def get_dataset_config(db, table_name):
+        return {"table_name": table_name}
+
+    async def get_layer_blob(layer, table_name):
+        return None, 3
+
+    async def iter_query_rows(statement, params=None, chunk_size=None, session_factory=None):
+        factories.append(session_factory)
+        yield {"objectid": 7, "geometry_wkt": "POINT(0 0)", "feature_hash": "x"}
+
+    class FakeRedis:
+        async def hgetall(self, key):
+            return {}
+
+        async def hset(self, key, mapping):
+            hashes.append((key, mapping))
+
+    monkeypatch.setattr(datasets, "get_dataset_config", get_dataset_config)
+    monkeypatch.setattr(datasets, "get_layer_blob", get_layer_blob)
+    monkeypatch.setattr(datasets, "iter_query_rows", iter_query_rows)
+    monkeypatch.setattr(datasets, "redis_client", FakeRedis())
+
+    rows = asyncio.run(datasets.get_dataset_data("hydrants", request=None, format=None, db=None))
+
+    assert rows == [{"objectid": 7, "geometry": "POINT(0 0)"}]
+    assert factories == [datasets.AsyncSessionLocal]
+    assert [key for key, _ in hashes] == ["hydrants:all"]
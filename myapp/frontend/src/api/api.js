@@ -53,6 +53,54 @@ export const sendChatQuery = async (message, sessionId = null) => {
   }
 };
 
+// Streaming chat endpoint (server-sent events over a POST body).
+// Calls onEvent(eventName, data) for each event and resolves with the final "done" payload.
+export const streamChatQuery = async (message, sessionId = null, onEvent = () => {}) => {
+  const response = await fetch(`${API_BASE_URL}/chat/query/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ message, session_id: sessionId }),
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Chat stream failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result = null;
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let eventName = 'message';
+      let data = '';
+      rawEvent.split('\n').forEach((line) => {
+        if (line.startsWith('event: ')) eventName = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      });
+      const payload = data ? JSON.parse(data) : null;
+
+      if (eventName === 'error') {
+        throw new Error(payload?.detail || 'Chat stream error');
+      }
+      if (eventName === 'done') {
+        result = payload;
+      }
+      onEvent(eventName, payload);
+    }
+  }
+  return result;
+};
+
 // Create a new chat session
 export const createChatSession = async () => {
   try {
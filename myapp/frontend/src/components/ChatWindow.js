@@ -1,5 +1,5 @@
 import React, { useState, useRef, useEffect } from 'react';
-import { sendChatQuery, createChatSession, getChatHistory } from '../api/api';
+import { streamChatQuery, createChatSession, getChatHistory } from '../api/api';
 import './ChatWindow.css';
 
 function ChatWindow({ isOpen, onClose, onFilterMap }) {
@@ -174,27 +174,42 @@ function ChatWindow({ isOpen, onClose, onFilterMap }) {
     setIsLoading(true);
     
     try {
-      // Send the message to the API
-      const response = await sendChatQuery(inputValue, sessionId);
+      // Stream the reply: the map filter is applied as soon as the IDs are ready
+      // and the answer is shown token by token
+      let streamedText = '';
+      const response = await streamChatQuery(inputValue, sessionId, (event, data) => {
+        if (event === 'filter' && data.filter_ids.length > 0) {
+          onFilterMap(data.filter_ids, data.count, data.truncated ? data.total_count : data.count);
+        } else if (event === 'token') {
+          if (streamedText === '') {
+            setIsLoading(false);
+            setMessages(prevMessages => [...prevMessages, { type: 'ai', content: '' }]);
+          }
+          streamedText += data.text;
+          const content = stripMarkdown(streamedText);
+          setMessages(prevMessages => [
+            ...prevMessages.slice(0, -1),
+            { type: 'ai', content }
+          ]);
+        }
+      });
       
       // Update session ID if returned from server (for first message)
-      if (response.session_id && (!sessionId || response.session_id !== sessionId)) {
+      if (response && response.session_id && (!sessionId || response.session_id !== sessionId)) {
         setSessionId(response.session_id);
         localStorage.setItem('chatSessionId', response.session_id);
       }
       
-      // Check if this is a show query with filter IDs
-      if (response.is_show_query && response.filter_ids && response.filter_ids.length > 0) {
-        // Call the filter map function with the IDs
-        onFilterMap(response.filter_ids, response.filter_ids.length);
+      // Replace the streamed text with the final response
+      if (response) {
+        const aiMessage = {
+          type: 'ai',
+          content: stripMarkdown(response.response) // Strip markdown from AI response
+        };
+        setMessages(prevMessages =>
+          streamedText === '' ? [...prevMessages, aiMessage] : [...prevMessages.slice(0, -1), aiMessage]
+        );
       }
-      
-      // Add the AI response to our list
-      const aiMessage = {
-        type: 'ai',
-        content: stripMarkdown(response.response) // Strip markdown from AI response
-      };
-      setMessages(prevMessages => [...prevMessages, aiMessage]);
     } catch (error) {
       console.error('Error sending message:', error);
       // Add error message
@@ -40,6 +40,8 @@ function Map() {
   const [filteredWaterMains, setFilteredWaterMains] = useState([]);
   const [isFiltered, setIsFiltered] = useState(false);
   const [filterCount, setFilterCount] = useState(0);
+  // Matches before the server's row cap; larger than filterCount when the filter was truncated
+  const [filterTotal, setFilterTotal] = useState(0);
   const [featureBounds, setFeatureBounds] = useState(null);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState(null);
@@ -219,7 +221,7 @@ function Map() {
   };
 
   // Function to handle map filtering based on IDs (existing code)
-  const handleFilterMap = async (objectIds, count) => {
+  const handleFilterMap = async (objectIds, count, totalCount = count) => {
     try {
       console.log(`Starting to filter map with ${objectIds.length} IDs`);
       setIsLoading(true);
@@ -248,6 +250,7 @@ function Map() {
       setFilteredWaterMains(filteredGeoJson);
       setIsFiltered(true);
       setFilterCount(count);
+      setFilterTotal(totalCount);
       
       // Calculate bounds for the filtered features
       if (filteredGeoJson.length > 0) {
@@ -317,6 +320,7 @@ function Map() {
     setIsFiltered(false);
     setFilteredWaterMains([]);
     setFilterCount(0);
+    setFilterTotal(0);
     setFeatureBounds(null);
   };
 
@@ -614,7 +618,11 @@ function Map() {
             }}>
               {filterCount}
             </span> 
-            <span>features filtered</span>
+            <span>
+              {filterTotal > filterCount
+                ? `of ${filterTotal.toLocaleString()} matches shown (limit reached)`
+                : 'features filtered'}
+            </span>
           </div>
           <button 
             onClick={clearFilter}